@@ -0,0 +1,71 @@
+# Mob avoidance scaling: brute-force O(n^2) loop vs. the neighbour grid.
+#
+# Usage: $ python -m benchmarks.avoid_mobs [mob counts...]
+import sys
+import random
+import timeit
+import pygame as pg
+from types import SimpleNamespace
+from pyle.settings import AVOID_RADIUS
+from pyle.sprites import Mob
+from pyle.spatial import SpatialGrid
+from pyle.scheduler import Scheduler
+
+MOB_COUNTS = [50, 100, 200, 400, 800]
+DENSITY = 1500  # square pixels of map per mob
+REPEAT = 5
+
+
+def make_game(count):
+    side = int((count * DENSITY) ** 0.5)
+    rng = random.Random(count)
+    game = SimpleNamespace(
+        random=rng,
+        all_sprites=pg.sprite.Group(),
+        mobs=pg.sprite.Group(),
+        mob_img=pg.Surface((35, 43)),
+        player=SimpleNamespace(pos=pg.Vector2(0, 0)),
+        mob_grid=SpatialGrid(AVOID_RADIUS))
+    game.scheduler = Scheduler(game)
+    for _ in range(count):
+        Mob(game, rng.uniform(0, side), rng.uniform(0, side))
+    return game
+
+
+def avoid_brute_force(mob):
+    # the original implementation, kept here as the baseline
+    for other in mob.game.mobs:
+        if other != mob:
+            dist = mob.pos - other.pos
+            if 0 < dist.length() < AVOID_RADIUS:
+                mob.acc += dist.normalize()
+
+
+def frame_brute_force(game):
+    for mob in game.mobs:
+        avoid_brute_force(mob)
+
+
+def frame_grid(game):
+    game.mob_grid.clear()
+    for mob in game.mobs:
+        game.mob_grid.insert_point(mob, mob.pos)
+    for mob in game.mobs:
+        mob.avoid_mobs()
+
+
+def best_of(func, game):
+    return min(timeit.repeat(lambda: func(game), number=1, repeat=REPEAT))
+
+
+def main(counts):
+    print('%8s %14s %14s %8s' % ('mobs', 'brute (ms)', 'grid (ms)', 'speedup'))
+    for count in counts:
+        game = make_game(count)
+        brute = best_of(frame_brute_force, game) * 1000
+        grid = best_of(frame_grid, game) * 1000
+        print('%8d %14.3f %14.3f %7.1fx' % (count, brute, grid, brute / grid))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or MOB_COUNTS)
@@ -0,0 +1,208 @@
+# Times the simulation and rendering hot paths on level1.tmx and on
+# synthetic maps of increasing size, and writes the results as JSON so runs
+# from different commits can be compared.
+#
+# Usage: $ python -m benchmarks.suite --output bench.json
+#        $ python -m benchmarks.suite --maps level1 200x120 --mobs 1000
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import pygame as pg
+from pyle.headless import idle_input, spawn_mobs
+from pyle.main import Game, MAP_DIR, RESOURCE_DIR
+from pyle.pool import SpritePool
+from pyle.levels import Level
+from pyle.settings import TILESIZE, WEAPONS, AVOID_RADIUS
+from pyle.spatial import SpatialGrid
+from pyle.sprites import Bullet, collide_with_walls
+from pyle.tilemap import TiledMap
+
+MAPS = ['level1', '100x60', '200x120']
+MOB_COUNTS = [100, 400]
+BULLET_COUNTS = [0, 60]
+FRAMES = 60
+DT = 1 / 60
+GROUND_GIDS = range(1, 9)
+WALL_GID = 111
+WALL_CHANCE = 0.04
+
+
+def synthetic_tmx(cols, rows, directory, seed=0):
+    # random grass with scattered single-tile walls and the player centred
+    rng = random.Random(seed)
+    ground = []
+    walls = []
+    objects = []
+    for y in range(rows):
+        ground.append(','.join(str(rng.choice(GROUND_GIDS))
+                               for _ in range(cols)))
+        row = []
+        for x in range(cols):
+            if rng.random() < WALL_CHANCE and \
+                    (abs(x - cols // 2) > 2 or abs(y - rows // 2) > 2):
+                row.append(str(WALL_GID))
+                objects.append((x * TILESIZE, y * TILESIZE))
+            else:
+                row.append('0')
+        walls.append(','.join(row))
+    tsx = os.path.join(RESOURCE_DIR, 'spritesheet_tiles.tsx')
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<map version="1.2" orientation="orthogonal" renderorder="right-down"'
+        ' width="%d" height="%d" tilewidth="%d" tileheight="%d"'
+        ' infinite="0">' % (cols, rows, TILESIZE, TILESIZE),
+        ' <tileset firstgid="1" source="%s"/>' % tsx,
+    ]
+    for i, (name, data) in enumerate([('ground', ground), ('walls', walls)]):
+        lines.append(' <layer id="%d" name="%s" width="%d" height="%d">'
+                     % (i + 1, name, cols, rows))
+        lines.append('  <data encoding="csv">')
+        lines.append(',\n'.join(data))
+        lines.append('  </data>')
+        lines.append(' </layer>')
+    lines.append(' <objectgroup id="3" name="obstacles">')
+    lines.append('  <object id="1" name="player" x="%d" y="%d" width="%d"'
+                 ' height="%d"/>' % (cols // 2 * TILESIZE,
+                                     rows // 2 * TILESIZE, TILESIZE, TILESIZE))
+    for i, (x, y) in enumerate(objects, 2):
+        lines.append('  <object id="%d" name="wall" x="%d" y="%d" width="%d"'
+                     ' height="%d"/>' % (i, x, y, TILESIZE, TILESIZE))
+    lines.append(' </objectgroup>')
+    lines.append('</map>')
+    path = os.path.join(directory, 'synthetic_%dx%d.tmx' % (cols, rows))
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines))
+    return path
+
+
+def map_path(name, directory):
+    if 'x' in name:
+        cols, rows = (int(n) for n in name.split('x'))
+        return synthetic_tmx(cols, rows, directory)
+    return os.path.join(MAP_DIR, name + '.tmx')
+
+
+def measure(func, frames):
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return dict(mean_ms=sum(samples) / len(samples), min_ms=samples[0],
+                median_ms=samples[len(samples) // 2], max_ms=samples[-1])
+
+
+def setup(game, tiled_map, mobs, bullets):
+    game.levels.put(0, Level(tiled_map))
+    game.new(0)
+    rng = random.Random(mobs)
+    spawn_mobs(game, mobs, rng)
+    game.bullet_pool = SpritePool(Bullet, game, max(bullets, 1))
+    weapon = WEAPONS['pistol']
+    for _ in range(bullets):
+        angle = rng.uniform(0, 360)
+        game.bullet_pool.spawn(game.player.pos,
+                               pg.Vector2(1, 0).rotate(angle), weapon)
+    game.camera.update(game.player)
+    game.playing = True
+
+
+def collide_all(game):
+    for sprite in [game.player] + game.mobs.sprites():
+        sprite.hit_rect.centerx = sprite.pos.x
+        collide_with_walls(sprite, game.wall_grid, 'x')
+        sprite.hit_rect.centery = sprite.pos.y
+        collide_with_walls(sprite, game.wall_grid, 'y')
+
+
+def avoid_all(game):
+    grid = SpatialGrid(AVOID_RADIUS)
+    for mob in game.mobs:
+        grid.insert_point(mob, mob.pos)
+    game.mob_grid = grid
+    for mob in game.mobs:
+        mob.acc = pg.Vector2(0, 0)
+        mob.avoid_mobs()
+
+
+def bench_scenario(game, tiled_map, mobs, bullets, frames):
+    timings = {}
+    setup(game, tiled_map, mobs, bullets)
+    timings['collide_with_walls'] = measure(lambda: collide_all(game), frames)
+    if game.horde is None:
+        timings['avoid_mobs'] = measure(lambda: avoid_all(game), frames)
+    timings['draw'] = measure(game.draw, frames)
+    timings['draw_fog'] = measure(game._draw_fog, frames)
+    # update last: it moves, kills and respawns things
+    setup(game, tiled_map, mobs, bullets)
+    timings['update'] = measure(game.update, frames)
+    return timings
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--maps', nargs='+', default=MAPS,
+                        help="map names in resources/maps or COLSxROWS")
+    parser.add_argument('--mobs', nargs='+', type=int, default=MOB_COUNTS)
+    parser.add_argument('--bullets', nargs='+', type=int,
+                        default=BULLET_COUNTS)
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--engine', choices=['sprite', 'numpy'])
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    game = Game()
+    game.input = idle_input
+    game.dt = DT
+    if args.engine:
+        game.mob_engine = args.engine
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.maps:
+            path = map_path(name, directory)
+            start = time.perf_counter()
+            tiled_map = TiledMap(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            make_map = measure(tiled_map.make_map, 3)
+            print('%-10s load %8.2f ms  make_map %8.2f ms'
+                  % (name, load_ms, make_map['mean_ms']))
+            for mobs in args.mobs:
+                for bullets in args.bullets:
+                    timings = bench_scenario(game, tiled_map, mobs, bullets,
+                                             args.frames)
+                    timings['make_map'] = make_map
+                    results.append(dict(map=name, mobs=mobs, bullets=bullets,
+                                        load_ms=load_ms, timings=timings))
+                    summary = '  '.join(
+                        '%s %.3f' % (k, v['mean_ms'])
+                        for k, v in sorted(timings.items())
+                        if k != 'make_map')
+                    print('  mobs %5d bullets %4d  %s'
+                          % (mobs, bullets, summary))
+    report = dict(revision=git_revision(), python=platform.python_version(),
+                  pygame=pg.version.ver, engine=game.mob_engine,
+                  frames=args.frames, dt=DT, results=results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from pyle.horde import np, steer
+
+
+class SharedArray:
+    # A numpy array in a named shared memory block that workers can map
+    def __init__(self, shape, dtype):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, self.dtype, buffer=self.shm.buf)
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    def release(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+
+# worker side: shared blocks mapped by this process, by name
+_attached = {}
+
+
+def _attach(specs):
+    names = set(spec[0] for spec in specs.values())
+    for name in list(_attached):
+        if name not in names:
+            shm, array = _attached.pop(name)
+            del array
+            shm.close()
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        if name not in _attached:
+            shm = shared_memory.SharedMemory(name=name)
+            _attached[name] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+        arrays[key] = _attached[name][1]
+    return arrays
+
+
+def _steer_part(task):
+    specs, n, target, flow_grid, part, parts = task
+    arrays = _attach(specs)
+    flow = None
+    if flow_grid is not None:
+        flow = (arrays['flow_dist'], arrays['flow_dir']) + flow_grid
+    idx, acc, rot = steer(arrays['pos'][:n], arrays['alive'][:n], target,
+                          flow, part, parts)
+    arrays['acc'][idx] = acc
+    arrays['rot'][idx] = rot
+    arrays['active'][idx] = True
+
+
+class AIPool:
+    # Runs Horde steering in worker processes. Each update collects the
+    # steering computed from the previous update's snapshot, then writes a
+    # new snapshot to shared memory and starts the workers on it, so they
+    # run while the main loop integrates, collides and renders. Mobs react
+    # one update late. Shared buffers are only written while the workers
+    # are idle (between collecting and submitting).
+    def __init__(self, workers):
+        if np is None:
+            raise RuntimeError("AI_WORKERS requires numpy")
+        self.workers = workers
+        # workers must share our tracker; one of their own would unlink the
+        # buffers when the worker exits
+        resource_tracker.ensure_running()
+        # spawn rather than fork: the game already runs SDL and loader
+        # threads, whose locks a forked child could inherit held
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(workers)
+        self.arrays = {}
+        self.pending = None
+        self.count = 0  # slots in the pending snapshot
+        self.flow_source = None
+        self.flow_version = None
+        atexit.register(self.close)
+
+    def _array(self, key, shape, dtype):
+        shared = self.arrays.get(key)
+        if shared is None or shared.shape != shape or \
+                shared.dtype != np.dtype(dtype):
+            if shared is not None:
+                shared.release()
+            shared = self.arrays[key] = SharedArray(shape, dtype)
+            self.flow_source = None
+        return shared.array
+
+    def reset(self):
+        # drop steering meant for the previous level's horde
+        if self.pending is not None:
+            self.pending.wait()
+            self.pending = None
+
+    def exchange(self, horde, target, flow=None):
+        result = self._collect(horde)
+        self._submit(horde, target, flow)
+        return result
+
+    def _collect(self, horde):
+        if self.pending is None:
+            return np.zeros(0, dtype=int), np.zeros((0, 2)), np.zeros(0)
+        self.pending.get()
+        self.pending = None
+        n = self.count
+        # mobs killed since the snapshot get no steering
+        idx = np.flatnonzero(self.arrays['active'].array[:n] &
+                             horde.alive[:n])
+        return idx, self.arrays['acc'].array[idx], \
+            self.arrays['rot'].array[idx]
+
+    def _submit(self, horde, target, flow):
+        n = self.count = horde.count
+        capacity = len(horde.speed)
+        self._array('pos', (capacity, 2), float)[:n] = horde.pos[:n]
+        self._array('alive', (capacity,), bool)[:n] = horde.alive[:n]
+        self._array('active', (capacity,), bool)[:] = False
+        self._array('acc', (capacity, 2), float)
+        self._array('rot', (capacity,), float)
+        flow_grid = None
+        if flow is not None:
+            flow_dist, flow_dir = flow[:2]
+            flow_grid = flow[2:]
+            dist = self._array('flow_dist', flow_dist.shape, flow_dist.dtype)
+            direction = self._array('flow_dir', flow_dir.shape, float)
+            changed = horde.flow_changed
+            if self.flow_source is not flow_dist or (
+                    self.flow_version != horde.flow_version and (
+                        changed is None or
+                        self.flow_version != horde.flow_version - 1)):
+                dist[:] = flow_dist
+                direction[:] = flow_dir
+                self.flow_source = flow_dist
+            elif self.flow_version != horde.flow_version:
+                # the horde patched its arrays in place; copy the same tiles
+                dist[changed] = flow_dist[changed]
+                direction[changed] = flow_dir[changed]
+            self.flow_version = horde.flow_version
+        specs = dict((key, shared.spec)
+                     for key, shared in self.arrays.items())
+        target = (float(target[0]), float(target[1]))
+        self.pending = self.pool.map_async(
+            _steer_part, [(specs, n, target, flow_grid, part, self.workers)
+                          for part in range(self.workers)])
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+        self.pending = None
+        for shared in self.arrays.values():
+            shared.release()
+        self.arrays = {}
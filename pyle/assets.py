@@ -0,0 +1,46 @@
+import pygame as pg
+from concurrent.futures import ThreadPoolExecutor
+from pyle.settings import ASSET_WORKERS
+
+
+class AssetLoader:
+    # Decodes files on a thread pool. poll() runs on the main thread and
+    # applies each finished asset's main-thread step (e.g. convert_alpha),
+    # storing the result in self.results under its key.
+    def __init__(self, workers=ASSET_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.results = {}
+        self.total = 0
+
+    def add(self, key, load, *args, finish=None):
+        future = self.executor.submit(load, *args)
+        self.pending[future] = (key, finish)
+        self.total += 1
+
+    def image(self, key, path, alpha=True):
+        finish = pg.Surface.convert_alpha if alpha else pg.Surface.convert
+        self.add(key, pg.image.load, path, finish=finish)
+
+    def sound(self, key, path):
+        self.add(key, pg.mixer.Sound, path)
+
+    def poll(self):
+        for future in [f for f in self.pending if f.done()]:
+            key, finish = self.pending.pop(future)
+            # result() re-raises a failed load here, on the main thread
+            result = future.result()
+            self.results[key] = finish(result) if finish else result
+        if not self.pending:
+            self.executor.shutdown(wait=False)
+        return self.progress
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 1
+        return (self.total - len(self.pending)) / self.total
+
+    @property
+    def finished(self):
+        return not self.pending
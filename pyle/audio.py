@@ -0,0 +1,74 @@
+import pygame as pg
+from pyle.settings import SOUND_CHANNELS, SOUND_CATEGORIES, SOUND_RADIUS
+from pyle.settings import SOUND_REPEAT
+
+
+class VoiceManager:
+    # Plays effects on a fixed number of mixer channels. Each category has a
+    # priority and a voice limit: a category at its limit replaces its own
+    # oldest voice, otherwise a free channel is used, otherwise the oldest
+    # lowest-priority voice below the request's priority is cut. Positional
+    # sounds fade out with distance from the player and are dropped beyond
+    # SOUND_RADIUS, and the same sound is never restarted within
+    # SOUND_REPEAT ms. A dropped request costs a distance check at most, so
+    # mixer work stays flat however many mobs ask for sounds.
+    def __init__(self, game, channels=SOUND_CHANNELS,
+                 categories=SOUND_CATEGORIES):
+        self.game = game
+        self.categories = categories
+        pg.mixer.set_num_channels(channels)
+        self.channels = [pg.mixer.Channel(i) for i in range(channels)]
+        # (category, priority, start time) per channel, None when idle
+        self.voices = [None] * channels
+        self.last_played = {}
+        self.dropped = 0
+
+    def clear(self):
+        # game time restarts with each game; see Game.new()
+        self.last_played.clear()
+
+    def play(self, sound, category, pos=None):
+        volume = 1
+        if pos is not None:
+            dist = self.game.player.pos.distance_to(pos)
+            if dist >= SOUND_RADIUS:
+                self.dropped += 1
+                return None
+            volume = 1 - dist / SOUND_RADIUS
+        now = self.game.now
+        last = self.last_played.get(sound)
+        if last is not None and now - last < SOUND_REPEAT:
+            self.dropped += 1
+            return None
+        priority, limit = self.categories[category]
+        index = self._pick(category, priority, limit)
+        if index is None:
+            self.dropped += 1
+            return None
+        self.last_played[sound] = now
+        self.voices[index] = (category, priority, now)
+        channel = self.channels[index]
+        channel.play(sound)
+        channel.set_volume(volume)
+        return channel
+
+    def _pick(self, category, priority, limit):
+        free = None
+        same = []
+        victim = None
+        for i, channel in enumerate(self.channels):
+            voice = self.voices[i]
+            if voice is None or not channel.get_busy():
+                self.voices[i] = None
+                if free is None:
+                    free = i
+            elif voice[0] == category:
+                same.append(i)
+            elif voice[1] < priority and (
+                    victim is None or voice[1:] < self.voices[victim][1:]):
+                victim = i
+        if len(same) >= limit:
+            return min(same, key=lambda i: self.voices[i][2])
+        if free is not None:
+            return free
+        return victim
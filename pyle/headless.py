@@ -0,0 +1,200 @@
+# Run the simulation without a display at a fixed timestep, as fast as the
+# CPU allows.
+#
+# Usage: $ python -m pyle.headless --ticks 6000 --input bot --mobs 500
+#        $ python -m pyle.headless --replay session.pylr
+import os
+import sys
+import time
+import argparse
+import pygame as pg
+from pyle.settings import SIM_RATE, MOB_HIT_RECT, MOB_ENGINE, AI_WORKERS
+from pyle.main import Game
+from pyle.replay import Keys, Recorder, Recording, replay
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+KEY_NAMES = {
+    'left': pg.K_LEFT,
+    'right': pg.K_RIGHT,
+    'up': pg.K_UP,
+    'down': pg.K_DOWN,
+    'space': pg.K_SPACE,
+}
+
+
+NO_KEYS = Keys()
+
+
+def idle_input(game):
+    return NO_KEYS
+
+
+class ScriptedInput:
+    # Plays a list of (ticks, keys) steps, looping at the end.
+    # A script string looks like "up+space:60,left:30,:15".
+    def __init__(self, steps):
+        self.steps = steps
+        self.tick = 0
+        self.length = sum(ticks for ticks, _ in steps)
+
+    @classmethod
+    def parse(cls, script):
+        steps = []
+        for step in script.split(','):
+            names, ticks = step.split(':')
+            keys = Keys(KEY_NAMES[n] for n in names.split('+') if n)
+            steps.append((int(ticks), keys))
+        return cls(steps)
+
+    def __call__(self, game):
+        t = self.tick % self.length
+        self.tick += 1
+        for ticks, keys in self.steps:
+            if t < ticks:
+                return keys
+            t -= ticks
+        return NO_KEYS
+
+
+class BotInput:
+    # Turns toward the nearest mob, walks toward it when it is far away and
+    # shoots once it is roughly in the sights.
+    def __init__(self, aim=5, engage=300):
+        self.aim = aim
+        self.engage = engage
+
+    def __call__(self, game):
+        player = game.player
+        target = min(game.mobs, default=None,
+                     key=lambda m: (m.pos - player.pos).length_squared())
+        if target is None:
+            return NO_KEYS
+        offset = target.pos - player.pos
+        turn = (offset.angle_to(pg.Vector2(1, 0)) - player.rot + 180) \
+            % 360 - 180
+        pressed = []
+        if turn > self.aim:
+            pressed.append(pg.K_LEFT)
+        elif turn < -self.aim:
+            pressed.append(pg.K_RIGHT)
+        else:
+            pressed.append(pg.K_SPACE)
+        if offset.length_squared() > self.engage**2:
+            pressed.append(pg.K_UP)
+        return Keys(pressed)
+
+
+def spawn_mobs(game, count, rng=None):
+    # scatter extra mobs over the map wherever they don't overlap a wall
+    if rng is None:
+        rng = game.random
+    rect = MOB_HIT_RECT.copy()
+    spawned = 0
+    while spawned < count:
+        rect.center = (rng.uniform(0, game.map.width),
+                       rng.uniform(0, game.map.height))
+        if game.wall_grid.collideany(rect) is None:
+            game.mob_class(game, rect.centerx, rect.centery)
+            spawned += 1
+
+
+def run(game, ticks, dt, mobs=0, render=False, seed=None, record=None):
+    game.dt = dt
+    game.new(seed)
+    spawn_mobs(game, mobs)
+    if record:
+        game.recorder = Recorder(game, record, game.input, mobs)
+        game.input = game.recorder
+    game.playing = True
+    restarts = 0
+    start = time.perf_counter()
+    for _ in range(ticks):
+        pg.event.pump()
+        game.update()
+        if render:
+            game.draw()
+        game.profiler.end_frame()
+        if not game.playing:
+            if record:
+                # a recording covers a single game
+                break
+            restarts += 1
+            game.new()
+            spawn_mobs(game, mobs)
+            game.playing = True
+    elapsed = time.perf_counter() - start
+    if record:
+        game.recorder.save(game)
+        ticks = len(game.recorder.recording.ticks)
+    return dict(ticks=ticks, seconds=elapsed, restarts=restarts,
+                mobs=len(game.mobs), player_health=game.player.health)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=SIM_RATE * 60)
+    parser.add_argument('--dt', type=float, default=1 / SIM_RATE)
+    parser.add_argument('--input', default='bot',
+                        help="'idle', 'bot' or a script like 'up+space:60'")
+    parser.add_argument('--mobs', type=int, default=0,
+                        help='extra mobs to scatter over the map')
+    parser.add_argument('--engine', default=MOB_ENGINE,
+                        choices=['sprite', 'numpy'])
+    parser.add_argument('--ai-workers', type=int, default=AI_WORKERS,
+                        help="steer the 'numpy' horde in N processes")
+    parser.add_argument('--render', action='store_true',
+                        help='also draw every tick (to the dummy display)')
+    parser.add_argument('--seed', type=int,
+                        help='level seed (random when omitted)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record the run (up to the first game over)')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='play back a recording instead of --input')
+    parser.add_argument('--profile-csv',
+                        help='dump per-tick section timings to this file')
+    args = parser.parse_args(argv)
+
+    game = Game()
+    if args.replay:
+        return run_replay(game, args)
+    game.mob_engine = args.engine
+    game.ai_workers = args.ai_workers
+    if args.input == 'idle':
+        game.input = idle_input
+    elif args.input == 'bot':
+        game.input = BotInput()
+    else:
+        game.input = ScriptedInput.parse(args.input)
+    stats = run(game, args.ticks, args.dt, args.mobs, args.render,
+                args.seed, args.record)
+    if args.profile_csv:
+        game.profiler.dump_csv(args.profile_csv)
+    print('%d ticks in %.2fs: %.1f ticks/s (%.3f ms/tick), %d restarts, '
+          '%d mobs left' % (stats['ticks'], stats['seconds'],
+                            stats['ticks'] / stats['seconds'],
+                            stats['seconds'] / stats['ticks'] * 1000,
+                            stats['restarts'], stats['mobs']))
+
+
+def run_replay(game, args):
+    recording = Recording.load(args.replay)
+    start = time.perf_counter()
+    result, same = replay(game, recording, args.render, spawn_mobs)
+    elapsed = time.perf_counter() - start
+    if args.profile_csv:
+        game.profiler.dump_csv(args.profile_csv)
+    ticks = max(1, len(recording.ticks))
+    print('replayed %d ticks in %.2fs: %.1f ticks/s (%.3f ms/tick)'
+          % (ticks, elapsed, ticks / elapsed, elapsed / ticks * 1000))
+    if not same:
+        print('outcome differs from the recording:')
+        print('  recorded %s' % recording.result)
+        print('  replayed %s' % result)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import pygame as pg
+from pyle.settings import MOB_HEALTH, HEALTH_BAR_STEPS, HEALTH_BAR_HEIGHT
+from pyle.settings import GREEN, YELLOW, RED
+
+
+def color_band(health):
+    if health > 60:
+        return GREEN
+    elif health > 30:
+        return YELLOW
+    return RED
+
+
+class HealthBars:
+    # Mob health bars as an overlay: one prerendered bar per (quantized
+    # health, color band), blitted over the damaged mobs after the sprite
+    # pass so mobs can share their rotation frames untouched.
+    def __init__(self, width, height=HEALTH_BAR_HEIGHT,
+                 steps=HEALTH_BAR_STEPS):
+        self.width = width
+        self.height = height
+        self.steps = steps
+        self.bars = {}
+
+    def bar(self, health):
+        step = max(0, min(self.steps,
+                          int(self.steps * health / MOB_HEALTH)))
+        color = color_band(health)
+        key = step, color
+        bar = self.bars.get(key)
+        if bar is None:
+            bar = pg.Surface((max(1, self.width * step // self.steps),
+                              self.height))
+            bar.fill(color)
+            self.bars[key] = bar
+        return bar
+
+    def draw(self, surface, mobs):
+        # mobs: (mob, screen rect) pairs; bars sit centred on the top edge
+        offset = self.width // 2
+        surface.blits([(self.bar(mob.health), (rect.centerx - offset,
+                                               rect.top))
+                       for mob, rect in mobs], doreturn=False)
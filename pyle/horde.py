@@ -0,0 +1,198 @@
+import pygame as pg
+from pyle.settings import DETECT_RADIUS, AVOID_RADIUS, ZOMBIE_MOAN_CHANCE
+from pyle.settings import HORDE_CHUNK
+from pyle.sprites import Mob, collide_with_walls
+from pyle.navigation import UNREACHABLE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Horde:
+    # Structure-of-arrays mob state. Every live mob owns one slot; the
+    # seek/avoid/integrate step runs over all slots at once. Steering can
+    # be handed to an AIPool (ai), which returns it one update late.
+    def __init__(self, capacity=64, ai=None):
+        if np is None:
+            raise RuntimeError("MOB_ENGINE 'numpy' requires numpy")
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.health = np.zeros(capacity)
+        self.rot = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.flow = None
+        self.flow_version = None
+        self.flow_dist = None
+        self.flow_dir = None
+        self.flow_changed = None  # slots patched by the last refresh
+        self.ai = ai
+
+    def _grow(self):
+        capacity = len(self.speed) * 2
+        for name in ('pos', 'vel', 'speed', 'health', 'rot', 'alive',
+                     'active'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, x, y, speed, health):
+        if self.count == len(self.speed):
+            self._grow()
+        slot = self.count
+        self.count += 1
+        self.pos[slot] = (x, y)
+        self.vel[slot] = (0, 0)
+        self.speed[slot] = speed
+        self.health[slot] = health
+        self.rot[slot] = 0
+        self.alive[slot] = True
+        return slot
+
+    def _flow_arrays(self, flow):
+        # copy the field into arrays once, then patch only the tiles each
+        # rebuild touched, so a player tile change costs O(window)
+        if self.flow is flow and self.flow_version == flow.version - 1:
+            cleared = np.array(flow.cleared, dtype=int)
+            self.flow_dist[cleared] = UNREACHABLE
+            self.flow_dir[cleared] = 0
+            reached = flow.reached
+            self.flow_dist[reached] = [flow.dist[i] for i in reached]
+            self.flow_dir[reached] = [(flow.flow_x[i], flow.flow_y[i])
+                                      for i in reached]
+            self.flow_changed = np.union1d(cleared, reached)
+        elif self.flow is not flow or self.flow_version != flow.version:
+            self.flow_dist = np.array(flow.dist)
+            self.flow_dir = np.column_stack((flow.flow_x, flow.flow_y))
+            self.flow_changed = None
+        self.flow = flow
+        self.flow_version = flow.version
+        return (self.flow_dist, self.flow_dir, flow.tile, flow.cols,
+                flow.rows)
+
+    def update(self, target, dt, flow=None):
+        n = self.count
+        if flow is not None:
+            flow = self._flow_arrays(flow)
+        if self.ai is not None:
+            idx, acc, rot = self.ai.exchange(self, target, flow)
+        else:
+            idx, acc, rot = steer(self.pos[:n], self.alive[:n], target, flow)
+        self.active[:n] = False
+        self.active[idx] = True
+        if not idx.size:
+            return
+        self.rot[idx] = rot
+
+        # integrate, scaling the steering vector to each mob's speed
+        length = np.sqrt(np.einsum('ij,ij->i', acc, acc))
+        length[length == 0] = 1
+        acc *= (self.speed[idx] / length)[:, None]
+        vel = self.vel[idx]
+        acc -= vel
+        vel += acc * dt
+        self.vel[idx] = vel
+        self.pos[idx] += vel * dt + 0.5 * acc * dt ** 2
+
+
+def steer(pos, alive, target, flow=None, part=0, parts=1):
+    # Seek and avoid for the mobs within DETECT_RADIUS of target. Returns
+    # their slots, unscaled steering vectors and facing angles. With parts >
+    # 1 only that share of the active mobs is steered (see pyle.aipool).
+    offset = np.array(target, dtype=float) - pos
+    dist2 = np.einsum('ij,ij->i', offset, offset)
+    idx = np.flatnonzero(alive & (dist2 < DETECT_RADIUS**2))
+    if parts > 1:
+        idx = np.array_split(idx, parts)[part]
+    if not idx.size:
+        return idx, np.zeros((0, 2)), np.zeros(0)
+
+    # seek: face the target and accelerate toward it, following the
+    # flow field around walls until next to it
+    off = offset[idx]
+    dist = np.sqrt(dist2[idx])
+    acc = np.zeros_like(off)
+    acc[:, 0] = 1
+    moving = dist > 0
+    acc[moving] = off[moving] / dist[moving, None]
+    mine = pos[idx]
+    if flow is not None:
+        flow_dist, flow_dir, tile, cols, rows = flow
+        cells = np.clip((mine[:, 1] // tile).astype(int), 0, rows - 1) * \
+            cols + np.clip((mine[:, 0] // tile).astype(int), 0, cols - 1)
+        far = flow_dist[cells] > 1
+        acc[far] = flow_dir[cells[far]]
+    rot = np.degrees(np.arctan2(-acc[:, 1], acc[:, 0]))
+
+    # avoid: only mobs near the detect circle can be neighbours of an
+    # active mob, which keeps the pairwise blocks small
+    reach = (DETECT_RADIUS + AVOID_RADIUS)**2
+    others = pos[alive & (dist2 < reach)]
+    for start in range(0, len(idx), HORDE_CHUNK):
+        block = mine[start:start + HORDE_CHUNK]
+        diff = block[:, None, :] - others[None, :, :]
+        d2 = np.einsum('ijk,ijk->ij', diff, diff)
+        near = (d2 > 0) & (d2 < AVOID_RADIUS**2)
+        inv = np.zeros_like(d2)
+        inv[near] = 1 / np.sqrt(d2[near])
+        acc[start:start + HORDE_CHUNK] += np.einsum('ijk,ij->ik', diff, inv)
+    return idx, acc, rot
+
+
+class HordeMob(Mob):
+    # A Mob whose physics live in the Horde arrays; update() only resolves
+    # walls, picks the rotation frame and handles death.
+    def __init__(self, game, x, y):
+        self.horde = game.horde
+        self.slot = self.horde.add(x, y, 0, 0)
+        self._vel = pg.Vector2(0, 0)
+        Mob.__init__(self, game, x, y)
+        self.horde.speed[self.slot] = self.speed
+
+    @property
+    def health(self):
+        return self.horde.health[self.slot]
+
+    @health.setter
+    def health(self, value):
+        self.horde.health[self.slot] = value
+
+    @property
+    def vel(self):
+        return self._vel
+
+    @vel.setter
+    def vel(self, value):
+        self._vel = pg.Vector2(value)
+        self.horde.vel[self.slot] = value
+
+    def update(self):
+        horde = self.horde
+        slot = self.slot
+        if horde.active[slot]:
+            if self.game.random.random() < ZOMBIE_MOAN_CHANCE:
+                self.game.audio.play(self.game.random.choice(
+                    self.game.zombie_moan_sounds), 'moan', self.pos)
+            self.rot = horde.rot[slot]
+            self.image = self.game.mob_rotations.get(self.rot)
+            self.rect = self.image.get_rect()
+            self.pos.update(*horde.pos[slot])
+            self._vel.update(*horde.vel[slot])
+            self.hit_rect.centerx = self.pos.x
+            collide_with_walls(self, self.game.wall_grid, 'x')
+            self.hit_rect.centery = self.pos.y
+            collide_with_walls(self, self.game.wall_grid, 'y')
+            self.rect.center = self.hit_rect.center
+            horde.pos[slot] = self.pos
+            horde.vel[slot] = self._vel
+        if self.health <= 0:
+            self.die()
+
+    def kill(self):
+        self.horde.alive[self.slot] = False
+        Mob.kill(self)
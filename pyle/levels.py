@@ -0,0 +1,75 @@
+import pygame as pg
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from pyle.settings import WIDTH, HEIGHT
+from pyle.tilemap import ChunkedMap
+from pyle.navigation import FlowField
+from pyle.mapcache import load_map
+
+# A map object to create when the level starts; rect is its map area and
+# pos its center
+Spawn = namedtuple('Spawn', 'name pos rect')
+
+
+class Level:
+    # The parts of a level that don't need the game: the parsed map, its
+    # spawn list, the flow field over its walls and the ground chunks in
+    # view of the player start. Built off the main thread by LevelLoader;
+    # finish() converts the map's tile images back on the main thread, and
+    # Game.start_level() only has to create the sprites.
+    def __init__(self, tiled_map):
+        self.map = tiled_map
+        self.spawns = []
+        for o in tiled_map.objects:
+            rect = pg.Rect(o.x, o.y, o.width, o.height)
+            pos = pg.Vector2(o.x + o.width / 2, o.y + o.height / 2)
+            self.spawns.append(Spawn(o.name, pos, rect))
+        self.walls = [spawn for spawn in self.spawns if spawn.name == 'wall']
+        self.flow_field = FlowField(tiled_map.width, tiled_map.height,
+                                    self.walls)
+        self.map_chunks = ChunkedMap(tiled_map)
+        for spawn in self.spawns:
+            if spawn.name == 'player':
+                view = pg.Rect(0, 0, WIDTH, HEIGHT)
+                view.center = spawn.pos
+                view.clamp_ip(pg.Rect(0, 0, tiled_map.width,
+                                      tiled_map.height))
+                for key in self.map_chunks.keys(view):
+                    self.map_chunks.get(key)
+
+    @classmethod
+    def load(cls, filename):
+        return cls(load_map(filename, convert=False))
+
+    def finish(self):
+        self.map.convert()
+        return self
+
+
+class LevelLoader:
+    # Prepares levels one at a time on a background thread. take() hands a
+    # level over, waiting only if it hasn't finished yet; each prepared
+    # Level is used once, since the game draws decals into its chunks.
+    def __init__(self, filenames):
+        self.filenames = filenames
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def preload(self, index):
+        if index not in self.pending:
+            self.pending[index] = self.executor.submit(
+                Level.load, self.filenames[index])
+
+    def put(self, index, level):
+        # use a level prepared elsewhere (e.g. during the loading screen)
+        future = Future()
+        future.set_result(level)
+        self.pending[index] = future
+
+    def take(self, index):
+        self.preload(index)
+        # result() re-raises a failed load here, on the main thread
+        return self.pending.pop(index).result().finish()
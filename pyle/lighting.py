@@ -0,0 +1,95 @@
+import pygame as pg
+from pyle.settings import WIDTH, HEIGHT, NIGHT_COLOR, LIGHTMAP_SCALE
+from pyle.settings import LIGHT_MASK_STEP, LIGHTMAP_SMOOTH
+
+
+class Lighting:
+    # Night-time lightmap built at reduced resolution. Static lights (map
+    # lamps) are composited into their own layer only when the camera
+    # moves; dynamic lights are added on top each frame, and the upscale is
+    # skipped when nothing moved on the lightmap. Lights combine
+    # with BLEND_RGB_MAX, so overlapping lights don't over-brighten.
+    def __init__(self, mask_image, size=(WIDTH, HEIGHT),
+                 scale=LIGHTMAP_SCALE):
+        self.mask_image = mask_image
+        self.size = size
+        self.scale = scale
+        small = (size[0] // scale, size[1] // scale)
+        self.lightmap = pg.Surface(small)
+        self.static_map = pg.Surface(small)
+        self.static_map.fill(NIGHT_COLOR)
+        self.screen_map = pg.Surface(size)
+        self.masks = {}
+        self.static_lights = []
+        self.static_offset = None
+        self.static_placed = []
+        self.key = None
+
+    def add_static(self, pos, radius):
+        self.static_lights.append((pg.Vector2(pos), radius))
+        self.static_offset = None
+
+    def remove_static(self, pos):
+        self.static_lights = [(p, r) for p, r in self.static_lights
+                              if p != pos]
+        self.static_offset = None
+
+    def clear_static(self):
+        self.static_lights = []
+        self.static_offset = None
+
+    def mask(self, radius):
+        # the gradient pre-scaled to lightmap resolution over the night
+        # color, so a single light looks just like blitting it onto fog
+        radius = max(LIGHT_MASK_STEP,
+                     int(radius) // LIGHT_MASK_STEP * LIGHT_MASK_STEP)
+        mask = self.masks.get(radius)
+        if mask is None:
+            size = max(1, 2 * radius // self.scale)
+            mask = pg.Surface((size, size))
+            mask.fill(NIGHT_COLOR)
+            mask.blit(pg.transform.smoothscale(self.mask_image,
+                                               (size, size)), (0, 0))
+            self.masks[radius] = mask
+        return mask
+
+    def _place(self, offset, pos, radius):
+        # (mask, lightmap position) for a light, in whole lightmap pixels
+        mask = self.mask(radius)
+        x = int((pos[0] + offset[0]) / self.scale) - mask.get_width() // 2
+        y = int((pos[1] + offset[1]) / self.scale) - mask.get_height() // 2
+        return mask, (x, y)
+
+    def draw(self, surface, camera, lights):
+        # lights: dynamic (map pos, radius) pairs for this frame
+        offset = camera.camera.topleft
+        if offset != self.static_offset:
+            self.static_offset = offset
+            view = camera.view
+            placed = []
+            for pos, radius in self.static_lights:
+                if view.inflate(radius * 2, radius * 2).collidepoint(pos):
+                    placed.append(self._place(offset, pos, radius))
+            if placed or self.static_placed:
+                self.static_map.fill(NIGHT_COLOR)
+                for mask, topleft in placed:
+                    self.static_map.blit(mask, topleft,
+                                         special_flags=pg.BLEND_RGB_MAX)
+            self.static_placed = placed
+        placed = [self._place(offset, pos, radius) for pos, radius in lights]
+        # the camera follows the player, so the composed lightmap is often
+        # identical to last frame's and the upscale can be skipped
+        key = [(id(mask), topleft) for mask, topleft in
+               self.static_placed + placed]
+        if key != self.key:
+            self.key = key
+            self.lightmap.blit(self.static_map, (0, 0))
+            for mask, topleft in placed:
+                self.lightmap.blit(mask, topleft,
+                                   special_flags=pg.BLEND_RGB_MAX)
+            if LIGHTMAP_SMOOTH:
+                pg.transform.smoothscale(self.lightmap, self.size,
+                                         self.screen_map)
+            else:
+                pg.transform.scale(self.lightmap, self.size, self.screen_map)
+        surface.blit(self.screen_map, (0, 0), special_flags=pg.BLEND_MULT)
@@ -1,18 +1,39 @@
 import os
 import sys
 import random
+import argparse
+import multiprocessing
 import pygame as pg
 from pyle.settings import TITLE, WIDTH, HEIGHT, FPS, GREEN, YELLOW, RED
 from pyle.settings import TILESIZE, WALL_IMG, BULLET_IMG, MOB_KNOCKBACK
-from pyle.settings import LIGHTGREY, MOB_DAMAGE, CYAN, BLACK, NIGHT_COLOR
+from pyle.settings import LIGHTGREY, MOB_DAMAGE, CYAN, BLACK
 from pyle.settings import WHITE, PLAYER_HEALTH, MUZZLE_FLASHES, ITEM_IMAGES
 from pyle.settings import HEALTH_PACK_AMOUNT, MOB_IMG, PLAYER_IMG, LIGHT_MASK
 from pyle.settings import BG_MUSIC, EFFECTS_SOUNDS, WEAPON_SOUNDS, LIGHT_RADIUS
 from pyle.settings import ZOMBIE_MOAN_SOUNDS, ZOMBIE_DEATH_SOUNDS, SPLAT_IMG
 from pyle.settings import PLAYER_HIT_SOUNDS, PLAYER_HIT_SOUND_CHANCE
+from pyle.settings import AVOID_RADIUS, ROTATION_STEP, MOB_ENGINE
+from pyle.settings import FLASH_SIZES, BULLET_POOL_SIZE, FLASH_POOL_SIZE
+from pyle.settings import PROFILE_CSV, FLASH_LIGHT_RADIUS, LAMP_RADIUS
+from pyle.settings import DIRTY_RECTS, DIRTY_RECT_LIMIT, AI_WORKERS, MOB_HEALTH
+from pyle.settings import SIM_RATE, MAX_FRAME_TIME, INTERPOLATE, LEVELS
 from pyle.sprites import Player, Spritesheet, Mob, Obstacle, collide_hit_rect
-from pyle.sprites import Item
-from pyle.tilemap import TiledMap, Camera
+from pyle.sprites import Item, RotationCache, Bullet, MuzzleFlash
+from pyle.tilemap import Camera
+from pyle.spatial import SpatialGrid, build_grid
+from pyle.horde import Horde, HordeMob
+from pyle.pool import SpritePool
+from pyle.text import TextCache
+from pyle.profiler import FrameProfiler
+from pyle.lighting import Lighting
+from pyle.levels import Level, LevelLoader
+from pyle.assets import AssetLoader
+from pyle.replay import Recorder
+from pyle.audio import VoiceManager
+from pyle.aipool import AIPool
+from pyle.healthbars import HealthBars
+from pyle.scheduler import Scheduler
+from pyle.projectiles import sweep_bullets
 
 
 # Support running from single .exe (via PyInstaller)
@@ -26,15 +47,24 @@ MUSIC_DIR = os.path.join(RESOURCE_DIR, 'music')
 MAP_DIR = os.path.join(RESOURCE_DIR, 'maps')
 
 
-def load_image(file, scale=None):
-    i = pg.image.load(os.path.join(IMG_DIR, file)).convert_alpha()
+def sound_file(file_and_volume):
+    if type(file_and_volume) is list:
+        return file_and_volume[0]
+    return file_and_volume
+
+
+def load_image(file, scale=None, preloaded=None):
+    if preloaded and file in preloaded:
+        i = preloaded[file]
+    else:
+        i = pg.image.load(os.path.join(IMG_DIR, file)).convert_alpha()
     if scale:
         return pg.transform.scale(i, scale)
     else:
         return i
 
 
-def load_sound(file_and_volume):
+def load_sound(file_and_volume, preloaded=None):
     volume = 1.0
     if type(file_and_volume) is list:
         file, volume = file_and_volume
@@ -51,7 +81,10 @@ def load_sound(file_and_volume):
     #         print("%s [%s]" % (self.name, self.get_volume()))
     # sound = DebugSound(os.path.join(SND_DIR, file))
 
-    sound = pg.mixer.Sound(os.path.join(SND_DIR, file))
+    if preloaded and file in preloaded:
+        sound = preloaded[file]
+    else:
+        sound = pg.mixer.Sound(os.path.join(SND_DIR, file))
     sound.set_volume(volume)
     return sound
 
@@ -73,6 +106,19 @@ def draw_player_health(surf, x, y, pct):
         color = RED
     pg.draw.rect(surf, color, fill_rect)
     pg.draw.rect(surf, WHITE, outline_rect, 2)
+    return outline_rect
+
+
+def merge_rects(rects):
+    # union overlapping rects so no screen area is repainted twice
+    merged = []
+    for rect in rects:
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect = rect.union(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
 
 
 class Game:
@@ -82,20 +128,54 @@ class Game:
         pg.display.set_caption(TITLE)
         self.screen = pg.display.set_mode((WIDTH, HEIGHT))
         self.clock = pg.time.Clock()
+        self.text_cache = TextCache()
+        self.audio = VoiceManager(self)
+        self.profiler = FrameProfiler()
         self.dt = None
+        # fraction of a simulation step elapsed since the last update, and
+        # each updated sprite's (rect center, rot) before that update
+        self.alpha = 1
+        self.prev_state = {}
+        self.now = 0  # simulation time in ms, advanced by update()
+        # all gameplay randomness comes from here so a level replays
+        # identically from its seed; see #new()
+        self.random = random.Random()
+        self.seed = None
         self.playing = False
-
-        # Game variables; see #new()
+        # Optional callable(game) returning key state in place of the
+        # keyboard; used by headless runs
+        self.input = None
+        self.recorder = None  # pyle.replay.Recorder while recording
+        self.mob_engine = MOB_ENGINE
+        self.ai_workers = AI_WORKERS
+        self.ai_pool = None
+        self.mob_class = None
+        self.levels = None  # LevelLoader over LEVELS
+        self.level = None  # index of the level being played
+
+        # Game variables; see #new() and #start_level()
         self.all_sprites = None
         self.player = None
         self.walls = None
+        self.wall_grid = None
         self.mobs = None
+        self.mob_grid = None
+        self.flow_field = None
+        self.horde = None
+        self.scheduler = None
         self.bullets = None
+        self.bullet_pool = None
+        self.flash_pool = None
         self.camera = None
         self.items = None
         self.draw_debug = None
+        self.draw_profile = False
         self.paused = None
         self.night = None
+        self.culled = 0
+        self.dirty_rects = DIRTY_RECTS
+        self.last_frame = (None, {})
+        self.hud_rects = []
 
         # Resources from disk
         self.title_font = None
@@ -103,17 +183,19 @@ class Game:
         self.dim_screen = None
         self.spritesheet_characters = None
         self.map = None
-        self.map_img = None
+        self.map_chunks = None
         self.player_img = None
         self.mob_img = None
+        self.player_rotations = None
+        self.mob_rotations = None
+        self.health_bars = None
         self.wall_img = None
         self.bullet_images = None
         self.splat_img = None
         self.gun_flashes = None
         self.item_images = None
-        self.fog = None
         self.light_mask = None
-        self.light_rect = None
+        self.lighting = None
         self.effect_sounds = None
         self.weapon_sounds = None
         self.zombie_moan_sounds = None
@@ -122,181 +204,416 @@ class Game:
         self.load_data()
 
     def load_data(self):
-        # Images and maps
         self.title_font = os.path.join(IMG_DIR, 'ZOMBIE.TTF')
         self.hud_font = os.path.join(IMG_DIR, 'Impacted2.0.ttf')
         self.dim_screen = pg.Surface(self.screen.get_size()).convert_alpha()
         self.dim_screen.fill((0, 0, 0, 180))
-        self.spritesheet_characters = Spritesheet(
-            os.path.join(IMG_DIR, 'spritesheet_characters.png'))
-        self.map = TiledMap(os.path.join(MAP_DIR, 'level1.tmx'))
+
+        # Decode everything in the background while the loading screen runs
+        assets = AssetLoader()
+        sheet_file = os.path.join(IMG_DIR, 'spritesheet_characters.png')
+        assets.image('spritesheet', sheet_file, alpha=False)
+        images = [WALL_IMG, BULLET_IMG, SPLAT_IMG, LIGHT_MASK]
+        images += MUZZLE_FLASHES + list(ITEM_IMAGES.values())
+        for file in images:
+            assets.image(file, os.path.join(IMG_DIR, file))
+        sounds = list(EFFECTS_SOUNDS.values()) + ZOMBIE_MOAN_SOUNDS
+        sounds += ZOMBIE_DEATH_SOUNDS + PLAYER_HIT_SOUNDS
+        for w in WEAPON_SOUNDS:
+            sounds += WEAPON_SOUNDS[w]
+        for s in sounds:
+            assets.sound(sound_file(s), os.path.join(SND_DIR, sound_file(s)))
+        # later levels are prepared in the background while playing
+        self.levels = LevelLoader([os.path.join(MAP_DIR, level)
+                                   for level in LEVELS])
+        assets.add('level', Level.load, self.levels.filenames[0],
+                   finish=Level.finish)
+        self.show_loading_screen(assets)
+        loaded = assets.results
+
+        # Images and maps
+        self.spritesheet_characters = Spritesheet(sheet_file,
+                                                  loaded['spritesheet'])
+        self.levels.put(0, loaded['level'])
         self.player_img = self.spritesheet_characters.get_image(PLAYER_IMG)
         self.mob_img = self.spritesheet_characters.get_image(MOB_IMG)
-        self.wall_img = load_image(WALL_IMG, scale=(TILESIZE, TILESIZE))
+        self.player_rotations = RotationCache(self.player_img, ROTATION_STEP)
+        self.mob_rotations = RotationCache(self.mob_img, ROTATION_STEP)
+        self.health_bars = HealthBars(min(self.mob_img.get_size()))
+        self.wall_img = load_image(WALL_IMG, (TILESIZE, TILESIZE), loaded)
         self.bullet_images = dict(
-            large=load_image(BULLET_IMG),
-            small=load_image(BULLET_IMG, scale=(10, 10)))
-        self.splat_img = load_image(SPLAT_IMG, scale=(64, 64))
+            large=load_image(BULLET_IMG, preloaded=loaded),
+            small=load_image(BULLET_IMG, (10, 10), loaded))
+        self.splat_img = load_image(SPLAT_IMG, (64, 64), loaded)
         self.gun_flashes = []
         for i in MUZZLE_FLASHES:
-            self.gun_flashes.append(load_image(i))
+            image = load_image(i, preloaded=loaded)
+            for size in FLASH_SIZES:
+                self.gun_flashes.append(
+                    pg.transform.scale(image, (size, size)))
         self.item_images = {}
         for i in ITEM_IMAGES:
-            self.item_images[i] = load_image(ITEM_IMAGES[i])
+            self.item_images[i] = load_image(ITEM_IMAGES[i],
+                                             preloaded=loaded)
 
         # Lighting effect / Fog of war
-        self.fog = pg.Surface((WIDTH, HEIGHT))
-        self.fog.fill(NIGHT_COLOR)
-        self.light_mask = load_image(LIGHT_MASK, scale=LIGHT_RADIUS)
-        self.light_rect = self.light_mask.get_rect()
+        self.light_mask = load_image(LIGHT_MASK, preloaded=loaded)
+        self.lighting = Lighting(self.light_mask)
 
         # Sounds and music
         pg.mixer_music.load(os.path.join(MUSIC_DIR, BG_MUSIC))
         self.effect_sounds = {}
         for s in EFFECTS_SOUNDS:
-            self.effect_sounds[s] = load_sound(EFFECTS_SOUNDS[s])
+            self.effect_sounds[s] = load_sound(EFFECTS_SOUNDS[s], loaded)
         self.zombie_moan_sounds = []
         for s in ZOMBIE_MOAN_SOUNDS:
-            self.zombie_moan_sounds.append(load_sound(s))
+            self.zombie_moan_sounds.append(load_sound(s, loaded))
         self.zombie_death_sounds = []
         for s in ZOMBIE_DEATH_SOUNDS:
-            self.zombie_death_sounds.append(load_sound(s))
+            self.zombie_death_sounds.append(load_sound(s, loaded))
         self.player_hit_sounds = []
         for s in PLAYER_HIT_SOUNDS:
-            self.player_hit_sounds.append(load_sound(s))
+            self.player_hit_sounds.append(load_sound(s, loaded))
         self.weapon_sounds = {}
         for w in WEAPON_SOUNDS:
             self.weapon_sounds[w] = []
             for s in WEAPON_SOUNDS[w]:
-                self.weapon_sounds[w].append(load_sound(s))
-
-    def new(self):
-        self.map_img = self.map.make_map()
-        self.map_rect = self.map_img.get_rect()
+                self.weapon_sounds[w].append(load_sound(s, loaded))
+
+    def new(self, seed=None):
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.seed = seed
+        self.random.seed(seed)
+        self.now = 0
+        self.audio.clear()
+        self.start_level(0)
+
+    def start_level(self, index):
+        # Swap in a prepared level; this runs between two updates, so it
+        # only creates sprites. The player keeps their health and weapon
+        # from the previous level of the same game.
+        carried = None
+        if index and self.player is not None:
+            carried = (self.player.health, self.player.weapon)
+        level = self.levels.take(index)
+        self.level = index
+        if index + 1 < len(self.levels):
+            self.levels.preload(index + 1)
+        self.levels.preload(0)  # for the next game
+        self.map = level.map
+        self.scheduler = Scheduler(self)
+        self.map_chunks = level.map_chunks
         self.all_sprites = pg.sprite.LayeredUpdates()
         self.walls = pg.sprite.Group()
         self.bullets = pg.sprite.Group()
         self.mobs = pg.sprite.Group()
         self.items = pg.sprite.Group()
-        # for row, tiles in enumerate(self.map.data):
-        #     for col, tile in enumerate(tiles):
-        #         if tile == '1':
-        #             Wall(self, col, row)
-        #         if tile == 'M':
-        #             Mob(self, col, row)
-        #         if tile == 'P':
-        #             self.player = Player(self, col, row)
-        for tile_object in self.map.tm.objects:
-            obj_center = pg.Vector2(tile_object.x + tile_object.width / 2,
-                                    tile_object.y + tile_object.height / 2)
-            if tile_object.name == 'player':
-                self.player = Player(self, obj_center.x, obj_center.y)
-            elif tile_object.name == 'wall':
-                Obstacle(self, tile_object.x, tile_object.y,
-                         tile_object.width, tile_object.height)
-            elif tile_object.name == 'zombie':
-                Mob(self, obj_center.x, obj_center.y)
-            elif tile_object.name in ITEM_IMAGES.keys():
-                Item(self, obj_center, tile_object.name)
+        self.bullet_pool = SpritePool(Bullet, self, BULLET_POOL_SIZE)
+        self.flash_pool = SpritePool(MuzzleFlash, self, FLASH_POOL_SIZE)
+        if self.mob_engine == 'numpy':
+            if self.ai_workers and self.ai_pool is None:
+                self.ai_pool = AIPool(self.ai_workers)
+            if self.ai_pool is not None:
+                self.ai_pool.reset()
+            self.horde = Horde(ai=self.ai_pool if self.ai_workers else None)
+            self.mob_class = HordeMob
+        else:
+            self.horde = None
+            self.mob_class = Mob
+        self.lighting.clear_static()
+        for spawn in level.spawns:
+            if spawn.name == 'player':
+                self.player = Player(self, spawn.pos.x, spawn.pos.y)
+            elif spawn.name == 'wall':
+                Obstacle(self, spawn.rect.x, spawn.rect.y,
+                         spawn.rect.width, spawn.rect.height)
+            elif spawn.name == 'zombie':
+                self.mob_class(self, spawn.pos.x, spawn.pos.y)
+            elif spawn.name in ITEM_IMAGES.keys():
+                Item(self, spawn.pos, spawn.name)
+            elif spawn.name == 'light':
+                self.lighting.add_static(
+                    spawn.pos, spawn.rect.width / 2 or LAMP_RADIUS)
+        if carried is not None:
+            self.player.health, self.player.weapon = carried
+        # walls never move, so index them once per level
+        self.wall_grid = build_grid(self.walls, TILESIZE)
+        self.mob_grid = SpatialGrid(AVOID_RADIUS)
+        self.flow_field = level.flow_field
         self.camera = Camera(self.map.width, self.map.height)
+        self.camera.update(self.player)
         self.draw_debug = False
         self.paused = False
         self.night = False
-        self.effect_sounds['level_start'].play()
+        self.last_frame = (None, {})
+        self.alpha = 1
+        self.prev_state = {}
+        self.audio.play(self.effect_sounds['level_start'], 'effect')
 
     def run(self):
+        # Simulate in fixed SIM_RATE steps and draw once per display frame,
+        # between the last two simulated states. Long frames are clamped so
+        # a hitch can't queue up an ever growing number of steps.
         self.playing = True
         pg.mixer_music.play(loops=-1)
+        self.dt = 1 / SIM_RATE
+        lag = 0
         while self.playing:
-            self.dt = self.clock.tick(FPS) / 1000
-            self.events()
+            frame = min(self.clock.tick(FPS) / 1000, MAX_FRAME_TIME)
+            with self.profiler.section('events'):
+                self.events()
             if not self.paused:
-                self.update()
+                lag += frame
+                while lag >= self.dt and self.playing:
+                    self.update()
+                    lag -= self.dt
+            self.alpha = lag / self.dt
             self.draw()
+            self.profiler.end_frame()
 
     def quit(self):
+        if self.recorder is not None:
+            self.recorder.save(self)
+        if self.ai_pool is not None:
+            self.ai_pool.close()
         pg.quit()
         sys.exit()
 
+    def get_keys(self):
+        if self.input is not None:
+            return self.input(self)
+        return pg.key.get_pressed()
+
     def update(self):
-        self.all_sprites.update()
+        self.now += self.dt * 1000
+        self.prev_state = {}
+        with self.profiler.section('flow field'):
+            self.flow_field.update(self.player.pos)
+        with self.profiler.section('mob steering'):
+            if self.horde is not None:
+                self.horde.update(self.player.pos, self.dt, self.flow_field)
+            # mobs move every frame, so their grid is rebuilt; sleeping
+            # mobs are out of reach of the player, other mobs and bullets
+            self.mob_grid.clear()
+            for mob in self.scheduler.awake(self.mobs):
+                self.mob_grid.insert_point(mob, mob.pos)
+        self._update_sprites()
         self.camera.update(self.player)
-        # game over?
-        if len(self.mobs) == 0:
-            self.playing = False
 
         # player hits items
-        hits = pg.sprite.spritecollide(self.player, self.items, False)
-        for hit in hits:
-            if hit.type == 'health' and self.player.health < PLAYER_HEALTH:
-                hit.kill()
-                self.effect_sounds['health_up'].play()
-                self.player.add_health(HEALTH_PACK_AMOUNT)
-            if hit.type == 'shotgun':
-                hit.kill()
-                self.effect_sounds['gun_pickup'].play()
-                self.player.weapon = 'shotgun'
+        with self.profiler.section('collide items'):
+            hits = pg.sprite.spritecollide(self.player, self.items, False)
+            for hit in hits:
+                if hit.type == 'health' and \
+                        self.player.health < PLAYER_HEALTH:
+                    hit.kill()
+                    self.audio.play(self.effect_sounds['health_up'],
+                                    'effect')
+                    self.player.add_health(HEALTH_PACK_AMOUNT)
+                if hit.type == 'shotgun':
+                    hit.kill()
+                    self.audio.play(self.effect_sounds['gun_pickup'],
+                                    'effect')
+                    self.player.weapon = 'shotgun'
 
         # mobs hit player
-        hits = pg.sprite.spritecollide(
-            self.player, self.mobs, False, collide_hit_rect)
-        for hit in hits:
-            if random.random() < PLAYER_HIT_SOUND_CHANCE:
-                random.choice(self.player_hit_sounds).play()
-            self.player.health -= MOB_DAMAGE
-            hit.vel = pg.Vector2(0, 0)
-            if self.player.health <= 0:
-                self.playing = False
-        if hits:
-            self.player.hit()
-            self.player.pos += pg.Vector2(
-                MOB_KNOCKBACK, 0).rotate(-hits[0].rot)
+        with self.profiler.section('collide mobs'):
+            # the grid holds last tick's positions; allow for movement
+            hits = [mob for mob in self.mob_grid.query_radius(
+                self.player.pos, AVOID_RADIUS * 2)
+                if collide_hit_rect(self.player, mob)]
+            for hit in hits:
+                if self.random.random() < PLAYER_HIT_SOUND_CHANCE:
+                    self.audio.play(
+                        self.random.choice(self.player_hit_sounds), 'player')
+                self.player.health -= MOB_DAMAGE
+                hit.vel = pg.Vector2(0, 0)
+                if self.player.health <= 0:
+                    self.playing = False
+            if hits:
+                self.player.hit()
+                self.player.pos += pg.Vector2(
+                    MOB_KNOCKBACK, 0).rotate(-hits[0].rot)
 
         # bullets hit mobs
-        hits = pg.sprite.groupcollide(self.mobs, self.bullets, False, True)
-        for mob in hits:
-            for bullet in hits[mob]:
-                mob.health -= bullet.weapon['damage']
-            mob.vel = pg.Vector2(0, 0)
+        with self.profiler.section('collide bullets'):
+            hits = sweep_bullets(self.bullets.sprites(), self.wall_grid,
+                                 self.mob_grid)
+            for mob in hits:
+                for bullet in hits[mob]:
+                    mob.health -= bullet.weapon['damage']
+                mob.vel = pg.Vector2(0, 0)
+                self.scheduler.wake(mob)
+
+        # level cleared: on to the next one, or game over after the last
+        if len(self.mobs) == 0 and self.playing:
+            if self.level + 1 < len(self.levels):
+                self.start_level(self.level + 1)
+            else:
+                self.playing = False
+
+    def _update_sprites(self):
+        # only the sprites the scheduler says are due, timed per class
+        self.scheduler.update(self._update_class)
+
+    def _update_class(self, cls, sprites):
+        # remember where each sprite was drawn so draw() can interpolate
+        rotates = hasattr(cls, 'rotated')
+        prev_state = self.prev_state
+        with self.profiler.section('update ' + cls.__name__):
+            for sprite in sprites:
+                if sprite.rect is not None:
+                    prev_state[sprite] = (sprite.rect.center,
+                                          sprite.rot if rotates else None)
+                sprite.update()
 
     def draw(self):
-        pg.display.set_caption("FPS: {:.2f}".format(self.clock.get_fps()))
+        with self.profiler.section('draw cull'):
+            alpha = self.alpha if INTERPOLATE else 1
+            self.camera.interpolate(alpha)
+            view = self.camera.view
+            visible = []
+            for sprite in self.all_sprites:
+                if view.colliderect(sprite.rect):
+                    visible.append((sprite,) + self._lerp(sprite, alpha))
+            self.culled = len(self.all_sprites) - len(visible)
+            damaged = [(mob, rect) for mob, _, rect in visible
+                       if isinstance(mob, Mob) and mob.health < MOB_HEALTH]
+            changed = self.map_chunks.take_changed()
+            dirty = None
+            if self.dirty_rects:
+                dirty = self._find_dirty(visible, changed)
+        if dirty is None:
+            self._draw_full(visible, damaged)
+        elif dirty:
+            self._draw_dirty(visible, damaged, dirty)
+        pg.display.set_caption("FPS: {:.2f} Culled: {}".format(
+            self.clock.get_fps(), self.culled))
+
+    def _lerp(self, sprite, alpha):
+        # image and screen rect for sprite between the state before the
+        # last update and its current one
+        state = self.prev_state.get(sprite)
+        if state is None or alpha >= 1:
+            return sprite.image, self.camera.apply(sprite)
+        (x, y), rot = state
+        image = sprite.image
+        if rot is not None and rot != sprite.rot:
+            turn = (sprite.rot - rot + 180) % 360 - 180
+            image = sprite.rotated(rot + turn * alpha)
+        cx, cy = sprite.rect.center
+        rect = image.get_rect(center=(round(x + (cx - x) * alpha),
+                                      round(y + (cy - y) * alpha)))
+        return image, self.camera.apply_rect(rect)
+
+    def _draw_full(self, visible, damaged):
         # self.screen.fill(BGCOLOR)
         # self.draw_grid()
-        self.screen.blit(self.map_img, self.camera.apply_rect(self.map_rect))
-        for sprite in self.all_sprites:
-            if isinstance(sprite, Mob):
-                sprite.draw_health()
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        with self.profiler.section('draw map'):
+            self.map_chunks.draw(self.screen, self.camera)
+        with self.profiler.section('draw sprites'):
+            for sprite, image, rect in visible:
+                self.screen.blit(image, rect)
+                if self.draw_debug:
+                    if hasattr(sprite, 'hit_rect'):
+                        pg.draw.rect(self.screen, CYAN, self.camera.apply_rect(
+                            sprite.hit_rect), 1)
             if self.draw_debug:
-                if hasattr(sprite, 'hit_rect'):
+                for wall in self.wall_grid.query(self.camera.view):
                     pg.draw.rect(self.screen, CYAN,
-                                 self.camera.apply_rect(sprite.hit_rect), 1)
-        if self.draw_debug:
-            for wall in self.walls:
-                pg.draw.rect(self.screen, CYAN,
-                             self.camera.apply_rect(wall.rect), 1)
+                                 self.camera.apply_rect(wall.rect), 1)
+        with self.profiler.section('draw health bars'):
+            self.health_bars.draw(self.screen, damaged)
 
         if self.night:
-            self._draw_fog()
-
-        # HUD functions
-        draw_player_health(self.screen, 10, 10,
-                           self.player.health / PLAYER_HEALTH)
-        self._draw_text("Zombies: %s" % len(self.mobs), self.hud_font, 30,
-                        WHITE, WIDTH - 10, 10, align="ne")
+            with self.profiler.section('draw fog'):
+                self._draw_fog()
+
+        self._draw_hud()
+        with self.profiler.section('display flip'):
+            pg.display.flip()
+
+    def _find_dirty(self, visible, changed):
+        # Screen rects that differ from the last frame: sprites that moved,
+        # changed image or health (old and new rect), new splats and the HUD.
+        # Returns None when the whole screen has to be redrawn instead.
+        frame = {}
+        for sprite, image, rect in visible:
+            frame[sprite] = (rect, image, getattr(sprite, 'health', None))
+        scene = (self.camera.camera.topleft, self.paused, self.night,
+                 self.draw_debug, self.draw_profile)
+        last_scene, last_frame = self.last_frame
+        self.last_frame = (scene, frame)
+        if scene != last_scene or self.night or self.draw_debug or \
+                self.draw_profile:
+            return None
         if self.paused:
-            self.screen.blit(self.dim_screen, (0, 0))
-            self._draw_text("Paused", self.title_font, 105, RED,
-                            WIDTH / 2, HEIGHT / 2, align="center")
-        pg.display.flip()
+            return []
+        dirty = [self.camera.apply_rect(rect) for rect in changed]
+        for sprite, state in frame.items():
+            old = last_frame.pop(sprite, None)
+            if old != state:
+                dirty.append(state[0])
+                if old is not None:
+                    dirty.append(old[0])
+        dirty.extend(old[0] for old in last_frame.values())
+        dirty.extend(self.hud_rects)
+        screen = self.screen.get_rect()
+        dirty = merge_rects(rect.clip(screen) for rect in dirty)
+        if sum(r.width * r.height for r in dirty) > \
+                DIRTY_RECT_LIMIT * WIDTH * HEIGHT:
+            return None
+        return dirty
+
+    def _draw_dirty(self, visible, damaged, dirty):
+        # repaint map and sprites clipped to each (disjoint) dirty rect
+        view = self.camera.view
+        with self.profiler.section('draw map'):
+            for rect in dirty:
+                self.screen.set_clip(rect)
+                self.map_chunks.draw(self.screen, self.camera,
+                                     rect.move(view.topleft))
+        with self.profiler.section('draw sprites'):
+            for rect in dirty:
+                self.screen.set_clip(rect)
+                for sprite, image, sprite_rect in visible:
+                    if rect.colliderect(sprite_rect):
+                        self.screen.blit(image, sprite_rect)
+        with self.profiler.section('draw health bars'):
+            for rect in dirty:
+                self.screen.set_clip(rect)
+                self.health_bars.draw(self.screen, [
+                    (mob, mob_rect) for mob, mob_rect in damaged
+                    if rect.colliderect(mob_rect)])
+            self.screen.set_clip(None)
+        self._draw_hud()
+        with self.profiler.section('display flip'):
+            pg.display.update(dirty + self.hud_rects)
+
+    def _draw_hud(self):
+        # HUD functions
+        with self.profiler.section('draw hud'):
+            self.hud_rects = [
+                draw_player_health(self.screen, 10, 10,
+                                   self.player.health / PLAYER_HEALTH),
+                self._draw_text("Zombies: %s" % len(self.mobs), self.hud_font,
+                                30, WHITE, WIDTH - 10, 10, align="ne")]
+            if self.draw_profile:
+                self.profiler.draw(self.screen, self.text_cache, 10, 40)
+            if self.paused:
+                self.screen.blit(self.dim_screen, (0, 0))
+                self._draw_text("Paused", self.title_font, 105, RED,
+                                WIDTH / 2, HEIGHT / 2, align="center")
 
     def _draw_fog(self):
-        # draw the light mask (gradient) onto fog image
-        self.fog.fill(NIGHT_COLOR)
-        self.light_rect.center = self.camera.apply(self.player).center
-        self.fog.blit(self.light_mask, self.light_rect)
-        self.screen.blit(self.fog, (0, 0), special_flags=pg.BLEND_MULT)
+        # the player's light follows its interpolated position
+        _, rect = self._lerp(self.player, self.alpha if INTERPOLATE else 1)
+        lights = [(rect.move(self.camera.view.topleft).center,
+                   LIGHT_RADIUS[0] / 2)]
+        for flash in self.flash_pool.active:
+            lights.append((flash.rect.center, FLASH_LIGHT_RADIUS))
+        self.lighting.draw(self.screen, self.camera, lights)
 
     def draw_grid(self):
         for x in range(0, WIDTH, TILESIZE):
@@ -305,8 +622,7 @@ class Game:
             pg.draw.line(self.screen, LIGHTGREY, (0, y), (WIDTH, y))
 
     def _draw_text(self, text, font_name, size, color, x, y, align="nw"):
-        font = pg.font.Font(font_name, size)
-        text_surface = font.render(text, True, color)
+        text_surface = self.text_cache.render(text, font_name, size, color)
         text_rect = text_surface.get_rect()
         if align == "nw":
             text_rect.topleft = (x, y)
@@ -327,6 +643,7 @@ class Game:
         if align == "center":
             text_rect.center = (x, y)
         self.screen.blit(text_surface, text_rect)
+        return text_rect
 
     def events(self):
         for event in pg.event.get():
@@ -341,9 +658,38 @@ class Game:
                     self.paused = not self.paused
                 if event.key == pg.K_n:
                     self.night = not self.night
+                if event.key == pg.K_o:
+                    self.draw_profile = not self.draw_profile
+                if event.key == pg.K_c:
+                    self.profiler.dump_csv(PROFILE_CSV)
+
+    def show_loading_screen(self, assets):
+        while not assets.finished:
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    self.quit()
+            progress = assets.poll()
+            self.screen.fill(BLACK)
+            self._draw_text(TITLE, self.title_font, 105, RED,
+                            WIDTH / 2, HEIGHT / 3, align="center")
+            self._draw_text('Loading...', self.title_font, 50, WHITE,
+                            WIDTH / 2, HEIGHT / 2, align="center")
+            bar = pg.Rect(0, 0, WIDTH / 2, 20)
+            bar.center = (WIDTH / 2, HEIGHT * 2 / 3)
+            pg.draw.rect(self.screen, GREEN,
+                         (bar.x, bar.y, bar.width * progress, bar.height))
+            pg.draw.rect(self.screen, WHITE, bar, 2)
+            pg.display.flip()
+            self.clock.tick(FPS)
 
     def show_start_screen(self):
-        pass
+        self.screen.fill(BLACK)
+        self._draw_text(TITLE, self.title_font, 105, RED,
+                        WIDTH / 2, HEIGHT / 3, align="center")
+        self._draw_text('Press any key to start', self.title_font, 75, WHITE,
+                        WIDTH / 2, HEIGHT * 3 / 4, align="center")
+        pg.display.flip()
+        self.wait_for_keypress()
 
     def show_gameover_screen(self):
         self.screen.fill(BLACK)
@@ -355,7 +701,8 @@ class Game:
         self.wait_for_keypress()
 
     def wait_for_keypress(self):
-        pg.event.wait()
+        if pg.event.wait().type == pg.QUIT:
+            self.quit()
         waiting = True
         while waiting:
             self.clock.tick(FPS)
@@ -367,9 +714,29 @@ class Game:
                     waiting = False
 
 
-g = Game()
-g.show_start_screen()
-while True:
-    g.new()
-    g.run()
-    g.show_gameover_screen()
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', metavar='FILE',
+                        help='record each game for replay (keeps the last)')
+    parser.add_argument('--seed', type=int,
+                        help='seed the first game instead of a random one')
+    args = parser.parse_args(argv)
+
+    g = Game()
+    g.show_start_screen()
+    seed = args.seed
+    while True:
+        g.new(seed)
+        seed = None
+        if args.record:
+            g.recorder = Recorder(g, args.record)
+            g.input = g.recorder
+        g.run()
+        if g.recorder is not None:
+            g.recorder.save(g)
+        g.show_gameover_screen()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # AI workers in the PyInstaller build
+    main()
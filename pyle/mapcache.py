@@ -0,0 +1,201 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import pygame as pg
+import xml.etree.ElementTree as xml
+from pyle.settings import MAP_CHUNK_SIZE
+from pyle.tilemap import TiledMap, MapObject
+
+# Compiled levels sit next to the .tmx as <name>.tmxc:
+#   MAGIC | header length (uint32) | JSON header
+#         | index length (uint32) | JSON index | chunk data
+# The header lists every source file, relative to the .tmx's directory,
+# with its mtime and sha1 so the cache can be validated before the (much
+# larger) rest is read. The index holds the map size and objects, and per
+# chunk its size, crc32 and the length of its zlib-compressed RGB pixels;
+# chunk data is those blobs in order.
+# Nothing in the file is executable, so a .tmxc shipped with a custom map
+# is as safe to open as the map itself.
+MAGIC = b'PYLEMAP3'
+LENGTH = struct.Struct('<I')
+
+
+def cache_path(filename):
+    return filename + 'c'
+
+
+def _sha1(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def dependencies(filename):
+    # the .tmx, its external .tsx tilesets and their tile sheet images
+    found = [filename]
+    directory = os.path.dirname(filename)
+    for tileset in xml.parse(filename).getroot().iter('tileset'):
+        base = directory
+        node = tileset
+        source = tileset.get('source')
+        if source:
+            tsx = os.path.normpath(os.path.join(directory, source))
+            found.append(tsx)
+            base = os.path.dirname(tsx)
+            node = xml.parse(tsx).getroot()
+        for image in node.iter('image'):
+            found.append(os.path.normpath(os.path.join(base,
+                                                       image.get('source'))))
+    return found
+
+
+def _fingerprint(paths, base):
+    # paths are stored relative to the map's directory, so a moved or
+    # copied install (or a PyInstaller temp dir) checks its own files
+    return [(os.path.relpath(path, base).replace(os.sep, '/'),
+             os.path.getmtime(path), _sha1(path)) for path in paths]
+
+
+def _is_fresh(fingerprint, filename):
+    base = os.path.dirname(filename)
+    for i, (source, mtime, sha1) in enumerate(fingerprint):
+        path = os.path.normpath(os.path.join(base, *source.split('/')))
+        # the first source is the .tmx the cache was compiled from
+        if i == 0 and path != os.path.normpath(filename):
+            return False
+        try:
+            if os.path.getmtime(path) != mtime and _sha1(path) != sha1:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+class CompiledMap:
+    # Same interface as TiledMap (width, height, objects, render, make_map)
+    # backed by pre-rendered ground chunks instead of pytmx tile data.
+    # Chunks are stored compressed and only decoded when rendered.
+    def __init__(self, filename, index, chunks):
+        self.filename = filename
+        self.width = index['width']
+        self.height = index['height']
+        self.chunk_size = index['chunk_size']
+        self.chunks = chunks
+        self.objects = [MapObject(*o) for o in index['objects']]
+        self.fallback = None  # parsed .tmx, if a chunk fails to decode
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            with open(cache_path(filename), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        try:
+            header, offset = _read_json(data, len(MAGIC))
+            if not _is_fresh(header['sources'], filename):
+                return None
+            index, offset = _read_json(data, offset)
+            chunks = {}
+            for col, row, width, height, crc, length in index['chunks']:
+                blob = data[offset:offset + length]
+                offset += length
+                if len(blob) != length or zlib.crc32(blob) != crc:
+                    return None
+                chunks[(col, row)] = ((width, height), blob)
+            return cls(filename, index, chunks)
+        except (struct.error, KeyError, TypeError, ValueError):
+            return None
+
+    def _chunk_image(self, key):
+        size, data = self.chunks[key]
+        try:
+            return pg.image.frombytes(zlib.decompress(data), size, 'RGB')
+        except (zlib.error, ValueError):
+            # damaged cache: draw this chunk from the .tmx instead
+            if self.fallback is None:
+                self.fallback = TiledMap(self.filename)
+            surface = pg.Surface(size)
+            self.fallback.render(surface, pg.Rect(
+                key[0] * self.chunk_size, key[1] * self.chunk_size, *size))
+            return surface
+
+    def render(self, surface, area=None):
+        if area is None:
+            area = pg.Rect(0, 0, self.width, self.height)
+        size = self.chunk_size
+        for row in range(area.top // size, (area.bottom - 1) // size + 1):
+            for col in range(area.left // size,
+                             (area.right - 1) // size + 1):
+                if (col, row) in self.chunks:
+                    surface.blit(self._chunk_image((col, row)),
+                                 (col * size - area.x, row * size - area.y))
+
+    def convert(self):
+        pass  # chunks are plain RGB surfaces; nothing to convert
+
+    def make_map(self):
+        temp_surface = pg.Surface((self.width, self.height))
+        self.render(temp_surface)
+        return temp_surface
+
+
+def _read_json(data, offset):
+    # one length-prefixed JSON section; returns it and the offset after it
+    (length,) = LENGTH.unpack_from(data, offset)
+    start = offset + LENGTH.size
+    if start + length > len(data):
+        raise ValueError('truncated')
+    return json.loads(data[start:start + length].decode('utf-8')), \
+        start + length
+
+
+def _json_section(value):
+    data = json.dumps(value).encode('utf-8')
+    return LENGTH.pack(len(data)) + data
+
+
+def compile_map(tiled_map, filename, chunk_size=MAP_CHUNK_SIZE):
+    chunks = []
+    blobs = []
+    for row in range(-(-tiled_map.height // chunk_size)):
+        for col in range(-(-tiled_map.width // chunk_size)):
+            rect = pg.Rect(col * chunk_size, row * chunk_size,
+                           chunk_size, chunk_size)
+            rect = rect.clip(pg.Rect(0, 0, tiled_map.width, tiled_map.height))
+            surface = pg.Surface(rect.size)
+            tiled_map.render(surface, rect)
+            data = zlib.compress(pg.image.tobytes(surface, 'RGB'), 1)
+            chunks.append((col, row, rect.width, rect.height,
+                           zlib.crc32(data), len(data)))
+            blobs.append(data)
+    header = dict(sources=_fingerprint(dependencies(filename),
+                                       os.path.dirname(filename)))
+    index = dict(width=tiled_map.width, height=tiled_map.height,
+                 chunk_size=chunk_size, chunks=chunks,
+                 objects=[tuple(o) for o in tiled_map.objects])
+    path = cache_path(filename)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(MAGIC + _json_section(header) + _json_section(index))
+        for data in blobs:
+            file.write(data)
+    os.replace(temp, path)
+
+
+def load_map(filename, convert=True):
+    # use the compiled level when it is still current; otherwise parse the
+    # .tmx and (re)write the cache for next time. Off the main thread, pass
+    # convert=False and call convert() on the result back on the main thread
+    compiled = CompiledMap.load(filename)
+    if compiled is not None:
+        return compiled
+    tiled_map = TiledMap(filename, convert)
+    try:
+        compile_map(tiled_map, filename)
+    except OSError:
+        pass  # read-only install; just use the parsed map
+    return tiled_map
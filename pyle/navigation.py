@@ -0,0 +1,127 @@
+import pygame as pg
+from collections import deque
+from pyle.settings import TILESIZE, FLOW_RADIUS
+
+UNREACHABLE = -1
+NEIGHBOURS = [(1, 0), (-1, 0), (0, 1), (0, -1),
+              (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+class FlowField:
+    # Breadth-first distance field over the map tiles, seeded at the goal
+    # (player) tile and shared by every mob. Each open tile stores a unit
+    # vector pointing at its lowest-distance neighbour. The field is only
+    # rebuilt when the goal moves to a different tile, and only covers the
+    # square within radius of the goal, since mobs further away don't chase.
+    def __init__(self, width, height, walls, tile=TILESIZE,
+                 radius=FLOW_RADIUS):
+        self.tile = tile
+        self.reach = -(-radius // tile)  # tiles from the goal to the edge
+        self.cols = -(-width // tile)
+        self.rows = -(-height // tile)
+        self.blocked = bytearray(self.cols * self.rows)
+        for wall in walls:
+            rect = wall.rect
+            for row in range(max(0, rect.top // tile),
+                             min(self.rows, (rect.bottom - 1) // tile + 1)):
+                for col in range(max(0, rect.left // tile),
+                                 min(self.cols, (rect.right - 1) // tile + 1)):
+                    self.blocked[row * self.cols + col] = 1
+        self.dist = [UNREACHABLE] * (self.cols * self.rows)
+        self.flow_x = [0.0] * (self.cols * self.rows)
+        self.flow_y = [0.0] * (self.cols * self.rows)
+        # walls never move, so the legal moves out of each tile are fixed
+        self.moves = [self._open_moves(i) for i in range(len(self.blocked))]
+        self.reached = []  # tiles given a distance by the last build
+        self.cleared = []  # tiles the last build reset (the build before's)
+        self.goal = None
+        self.version = 0
+
+    def cell(self, pos):
+        col = min(self.cols - 1, max(0, int(pos[0] // self.tile)))
+        row = min(self.rows - 1, max(0, int(pos[1] // self.tile)))
+        return row * self.cols + col
+
+    def update(self, pos):
+        goal = self.cell(pos)
+        if goal != self.goal:
+            self.goal = goal
+            self._build(goal)
+            self.version += 1
+
+    def _open_moves(self, index):
+        # 8-way moves as (tile, unit x, unit y); diagonals may not cut the
+        # corner of a blocked tile
+        cols = self.cols
+        row, col = divmod(index, cols)
+        blocked = self.blocked
+        moves = []
+        for dx, dy in NEIGHBOURS:
+            x = col + dx
+            y = row + dy
+            if not (0 <= x < cols and 0 <= y < self.rows):
+                continue
+            if blocked[y * cols + x]:
+                continue
+            if dx and dy and (blocked[row * cols + x] or
+                              blocked[y * cols + col]):
+                continue
+            direction = pg.Vector2(dx, dy).normalize()
+            moves.append((y * cols + x, direction.x, direction.y))
+        return moves
+
+    def _build(self, goal):
+        # the lists are updated in place: only the tiles the last build
+        # reached are reset
+        dist = self.dist
+        flow_x = self.flow_x
+        flow_y = self.flow_y
+        self.cleared = self.reached
+        for index in self.cleared:
+            dist[index] = UNREACHABLE
+            flow_x[index] = 0.0
+            flow_y[index] = 0.0
+        cols = self.cols
+        goal_row, goal_col = divmod(goal, cols)
+        left = max(0, goal_col - self.reach)
+        right = min(cols, goal_col + self.reach + 1)
+        top = max(0, goal_row - self.reach)
+        bottom = min(self.rows, goal_row + self.reach + 1)
+        blocked = self.blocked
+        dist[goal] = 0
+        reached = [goal]
+        queue = deque([goal])
+        while queue:
+            index = queue.popleft()
+            row, col = divmod(index, cols)
+            step = dist[index] + 1
+            for x, y in ((col + 1, row), (col - 1, row),
+                         (col, row + 1), (col, row - 1)):
+                if left <= x < right and top <= y < bottom:
+                    other = y * cols + x
+                    if dist[other] == UNREACHABLE and not blocked[other]:
+                        dist[other] = step
+                        queue.append(other)
+                        reached.append(other)
+        self.reached = reached
+
+        moves = self.moves
+        for index in reached:
+            here = dist[index]
+            if here == 0:
+                continue
+            best = here
+            for other, fx, fy in moves[index]:
+                there = dist[other]
+                if there != UNREACHABLE and there < best:
+                    best = there
+                    flow_x[index] = fx
+                    flow_y[index] = fy
+
+    def direction(self, pos):
+        # None when pos is at/next to the goal or has no path to it; callers
+        # should then steer straight at the target
+        index = self.cell(pos)
+        if self.dist[index] <= 1:
+            return None
+        return pg.Vector2(self.flow_x[index], self.flow_y[index])
@@ -0,0 +1,18 @@
+class SpritePool:
+    # Fixed set of reusable sprites. Pooled sprites call release() from
+    # kill(); when every sprite is in use the oldest one is recycled.
+    def __init__(self, cls, game, capacity):
+        self.free = [cls(game, self) for _ in range(capacity)]
+        self.active = []
+
+    def spawn(self, *args):
+        if not self.free:
+            self.active[0].kill()
+        sprite = self.free.pop()
+        self.active.append(sprite)
+        sprite.spawn(*args)
+        return sprite
+
+    def release(self, sprite):
+        self.active.remove(sprite)
+        self.free.append(sprite)
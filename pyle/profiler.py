@@ -0,0 +1,79 @@
+import csv
+import time
+import pygame as pg
+from collections import deque
+from contextlib import contextmanager
+from pyle.settings import PROFILE_WINDOW, PROFILE_REFRESH, WHITE
+
+
+class FrameProfiler:
+    # Accumulates milliseconds per named section for the current frame and
+    # keeps the last PROFILE_WINDOW frames for percentiles and CSV dumps.
+    def __init__(self, window=PROFILE_WINDOW):
+        self.window = window
+        self.names = []
+        self.current = {}
+        self.history = deque(maxlen=window)
+        self.frame = 0
+        self.overlay = None
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        if name not in self.current:
+            self.current[name] = 0
+            if name not in self.names:
+                self.names.append(name)
+        self.current[name] += ms
+
+    def end_frame(self):
+        self.history.append(self.current)
+        self.current = {}
+        self.frame += 1
+
+    def percentiles(self, name, points=(50, 95, 99)):
+        samples = sorted(frame.get(name, 0) for frame in self.history)
+        if not samples:
+            return [0 for _ in points]
+        last = len(samples) - 1
+        return [samples[min(last, int(round(p / 100 * last)))]
+                for p in points]
+
+    def draw(self, surface, text_cache, x, y, size=18):
+        # re-rendering every frame would itself show up in the profile
+        if self.overlay is None or self.frame % PROFILE_REFRESH == 0:
+            rows = [['ms', 'p50', 'p95', 'p99']]
+            for name in self.names:
+                rows.append([name] + ['%.2f' % p
+                                      for p in self.percentiles(name)])
+            font = text_cache.font(None, size)
+            height = font.get_linesize()
+            widths = [max(font.size(row[i])[0] for row in rows) + 10
+                      for i in range(len(rows[0]))]
+            self.overlay = pg.Surface((sum(widths) + 10,
+                                       height * len(rows) + 10), pg.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 180))
+            for i, row in enumerate(rows):
+                # name left aligned, numbers right aligned
+                left = 5
+                for j, cell in enumerate(row):
+                    image = font.render(cell, True, WHITE)
+                    offset = 0 if j == 0 else widths[j] - image.get_width()
+                    self.overlay.blit(image, (left + offset, 5 + i * height))
+                    left += widths[j]
+        surface.blit(self.overlay, (x, y))
+
+    def dump_csv(self, path):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame'] + self.names)
+            first = self.frame - len(self.history)
+            for i, frame in enumerate(self.history):
+                writer.writerow([first + i] + ['%.4f' % frame.get(name, 0)
+                                               for name in self.names])
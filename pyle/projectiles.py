@@ -0,0 +1,49 @@
+import pygame as pg
+from pyle.settings import TILESIZE
+
+# how far a mob's rect can stick out from the position it is indexed by
+MOB_REACH = TILESIZE
+
+
+def _entry(rect, start, end):
+    # squared distance from start to where start->end enters rect, or None
+    clipped = rect.clipline(start, end)
+    if not clipped:
+        return None
+    x, y = clipped[0]
+    return (x - start[0])**2 + (y - start[1])**2
+
+
+def sweep_bullets(bullets, wall_grid, mob_grid):
+    # Sweep each bullet's rect along its path this tick (prev_pos to pos)
+    # against the walls and mobs near it, so fast bullets can't tunnel
+    # through either when dt is large. A bullet stops at whatever it reaches
+    # first and is killed. Returns {mob: [bullets]} for the bullets that
+    # stopped in a mob.
+    hits = {}
+    for bullet in bullets:
+        start = bullet.prev_pos
+        end = bullet.pos
+        width, height = bullet.rect.size
+        path = pg.Rect(min(start.x, end.x), min(start.y, end.y),
+                       abs(end.x - start.x) + 1, abs(end.y - start.y) + 1)
+        path.inflate_ip(width, height)
+        nearest = None
+        target = None
+        for wall in wall_grid.query(path):
+            dist = _entry(wall.rect.inflate(width, height), start, end)
+            if dist is not None and (nearest is None or dist < nearest):
+                nearest = dist
+        reach = start.distance_to(end) / 2 + MOB_REACH
+        for mob in mob_grid.query_radius((start + end) / 2, reach):
+            if not mob.alive():
+                continue
+            dist = _entry(mob.rect.inflate(width, height), start, end)
+            if dist is not None and (nearest is None or dist < nearest):
+                nearest = dist
+                target = mob
+        if nearest is not None:
+            bullet.kill()
+            if target is not None:
+                hits.setdefault(target, []).append(bullet)
+    return hits
@@ -0,0 +1,147 @@
+# Record a play session as the level seed plus one (keys, dt) entry per
+# simulation tick, and play it back at full speed with the same outcome.
+#
+# Usage: $ python -m pyle.main --record session.pylr
+#        $ python -m pyle.headless --replay session.pylr --render
+import json
+import zlib
+import struct
+import pygame as pg
+
+# .pylr files:
+#   MAGIC | header length (uint32) | JSON header | zlib(ticks)
+# Each tick is the pressed-key bitmask (uint8) and the dt it ran with
+# (float64, so playback feeds the simulation bit-identical timesteps).
+MAGIC = b'PYLEREC1'
+LENGTH = struct.Struct('<I')
+TICK = struct.Struct('<Bd')
+
+# bit -> keys that set it; WASD record as the arrow keys they alias
+KEY_BITS = [
+    (pg.K_LEFT, pg.K_a),
+    (pg.K_RIGHT, pg.K_d),
+    (pg.K_UP, pg.K_w),
+    (pg.K_DOWN, pg.K_s),
+    (pg.K_SPACE,),
+]
+
+
+def encode_keys(keys):
+    mask = 0
+    for bit, aliases in enumerate(KEY_BITS):
+        if any(keys[key] for key in aliases):
+            mask |= 1 << bit
+    return mask
+
+
+class Keys:
+    # Stands in for pg.key.get_pressed(): indexable by key constant
+    def __init__(self, pressed=()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+def decode_keys(mask):
+    return Keys(aliases[0] for bit, aliases in enumerate(KEY_BITS)
+                if mask & (1 << bit))
+
+
+def outcome(game):
+    # compared after playback to check the replay stayed in sync
+    return dict(now=game.now, player_health=game.player.health,
+                player_pos=[round(game.player.pos.x, 3),
+                            round(game.player.pos.y, 3)],
+                mobs=len(game.mobs))
+
+
+class Recording:
+    def __init__(self, seed, engine, mobs=0, ticks=None, result=None,
+                 ai_workers=0):
+        self.seed = seed
+        self.engine = engine
+        # steering lags one update with AI workers, which changes the run
+        self.ai_workers = ai_workers
+        self.mobs = mobs  # extra mobs scattered by the headless runner
+        self.ticks = ticks if ticks is not None else []
+        self.result = result
+
+    def save(self, path):
+        header = json.dumps(dict(seed=self.seed, engine=self.engine,
+                                 mobs=self.mobs, result=self.result,
+                                 ai_workers=self.ai_workers))
+        header = header.encode('utf-8')
+        data = b''.join(TICK.pack(mask, dt) for mask, dt in self.ticks)
+        with open(path, 'wb') as file:
+            file.write(MAGIC + LENGTH.pack(len(header)) + header +
+                       zlib.compress(data))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if not data.startswith(MAGIC):
+            raise ValueError('%s is not a pyle recording' % path)
+        start = len(MAGIC) + LENGTH.size
+        (length,) = LENGTH.unpack_from(data, len(MAGIC))
+        header = json.loads(data[start:start + length].decode('utf-8'))
+        ticks = list(TICK.iter_unpack(zlib.decompress(data[start + length:])))
+        return cls(header['seed'], header['engine'], header['mobs'], ticks,
+                   header['result'], header.get('ai_workers', 0))
+
+
+class Recorder:
+    # Input callable that passes another source's keys through while
+    # logging them with the tick's dt. The player polls input exactly once
+    # per update, so the log has one entry per simulation tick.
+    def __init__(self, game, path, source=None, mobs=0):
+        self.path = path
+        self.source = source
+        self.recording = Recording(game.seed, game.mob_engine, mobs,
+                                   ai_workers=game.ai_workers)
+
+    def __call__(self, game):
+        if self.source is not None:
+            keys = self.source(game)
+        else:
+            keys = pg.key.get_pressed()
+        self.recording.ticks.append((encode_keys(keys), game.dt))
+        return keys
+
+    def save(self, game):
+        self.recording.result = outcome(game)
+        self.recording.save(self.path)
+
+
+class Playback:
+    # Input callable feeding back the recorded keys tick by tick
+    def __init__(self, recording):
+        self.recording = recording
+        self.tick = 0
+
+    def __call__(self, game):
+        mask, _ = self.recording.ticks[self.tick]
+        return decode_keys(mask)
+
+
+def replay(game, recording, render=False, spawn=None):
+    # Restart the level with the recorded seed and re-run every tick. spawn
+    # (game, count) re-creates the extra mobs of headless recordings.
+    game.mob_engine = recording.engine
+    game.ai_workers = recording.ai_workers
+    game.new(recording.seed)
+    if recording.mobs and spawn is not None:
+        spawn(game, recording.mobs)
+    game.playing = True
+    playback = Playback(recording)
+    game.input = playback
+    for playback.tick, (_, dt) in enumerate(recording.ticks):
+        game.dt = dt
+        pg.event.pump()
+        game.update()
+        if render:
+            game.draw()
+        game.profiler.end_frame()
+    result = outcome(game)
+    return result, result == recording.result
@@ -0,0 +1,117 @@
+from pyle.settings import WAKE_RADIUS, FULL_RATE_RADIUS, REDUCED_RATE
+
+# awake sprites only go back to sleep this far beyond WAKE_RADIUS, so one
+# hovering at the edge doesn't flip every tick
+SLEEP_MARGIN = 100
+
+
+class Scheduler:
+    # Decides which sprites update each tick. Mobs and items far from the
+    # player sleep in a coarse grid until a proximity query around the
+    # player (or wake(), e.g. when shot) wakes them. Awake mobs further than
+    # FULL_RATE_RADIUS update every REDUCED_RATE ticks, staggered, until
+    # wake() puts them back on every tick; the rest update every tick.
+    # The player, bullets and effects always update.
+    # Dicts keep every tier in a stable order so replays stay identical.
+    def __init__(self, game):
+        self.game = game
+        self.order = {}  # sprite -> (spawn sequence, reducible)
+        self.spawned = 0
+        self.full = {}
+        self.reduced = [{} for _ in range(REDUCED_RATE)]
+        self.sleeping = {}  # cell -> {sprite: None}
+        self.cells = {}  # sleeping sprite -> its cell
+        self.tick = 0
+
+    def add(self, sprite, reducible=True):
+        # placed properly after its first update
+        self.order[sprite] = (self.spawned, reducible)
+        self.spawned += 1
+        self.full[sprite] = None
+
+    def _cell(self, pos):
+        return int(pos[0] // WAKE_RADIUS), int(pos[1] // WAKE_RADIUS)
+
+    def _sleep(self, sprite):
+        cell = self.cells[sprite] = self._cell(sprite.pos)
+        self.sleeping.setdefault(cell, {})[sprite] = None
+
+    def wake(self, sprite):
+        # back to every-tick updates, from sleep or a reduced-rate tier
+        cell = self.cells.pop(sprite, None)
+        if cell is not None:
+            del self.sleeping[cell][sprite]
+            self.full[sprite] = None
+        elif sprite not in self.full and sprite in self.order:
+            tier = self.reduced[self.order[sprite][0] % REDUCED_RATE]
+            if sprite in tier:
+                del tier[sprite]
+                self.full[sprite] = None
+
+    def _wake_near(self, pos):
+        col, row = self._cell(pos)
+        for cell in [(c, r) for c in range(col - 1, col + 2)
+                     for r in range(row - 1, row + 2)]:
+            for sprite in list(self.sleeping.get(cell, ())):
+                if not sprite.alive():
+                    del self.sleeping[cell][sprite]
+                    del self.cells[sprite]
+                    del self.order[sprite]
+                elif (sprite.pos - pos).length_squared() < WAKE_RADIUS**2:
+                    self.wake(sprite)
+
+    def _retier(self, sprite, tier, pos):
+        # move an updated sprite to the tier its new distance calls for
+        dist2 = (sprite.pos - pos).length_squared()
+        seq, reducible = self.order[sprite]
+        if dist2 > (WAKE_RADIUS + SLEEP_MARGIN)**2:
+            new = None
+        elif reducible and dist2 > FULL_RATE_RADIUS**2:
+            new = self.reduced[seq % REDUCED_RATE]
+        else:
+            new = self.full
+        if new is not tier:
+            del tier[sprite]
+            if new is None:
+                self._sleep(sprite)
+            else:
+                new[sprite] = None
+
+    def due(self):
+        # the sprites to update this tick, in a deterministic order
+        game = self.game
+        self.tick += 1
+        self._wake_near(game.player.pos)
+        tiered = []
+        for tier in (self.full, self.reduced[self.tick % REDUCED_RATE]):
+            for sprite in list(tier):
+                if sprite.alive():
+                    tiered.append((self.order[sprite][0], sprite, tier))
+                else:
+                    del tier[sprite]
+                    del self.order[sprite]
+        tiered.sort(key=lambda entry: entry[0])
+        return tiered
+
+    def update(self, run):
+        # run(cls, sprites) updates a list of sprites of one class
+        game = self.game
+        tiered = self.due()
+        by_class = {type(game.player): [game.player]}
+        for _, sprite, _ in tiered:
+            by_class.setdefault(type(sprite), []).append(sprite)
+        for sprite in game.bullets.sprites() + list(game.flash_pool.active):
+            by_class.setdefault(type(sprite), []).append(sprite)
+        for cls, sprites in by_class.items():
+            run(cls, sprites)
+        pos = game.player.pos
+        for _, sprite, tier in tiered:
+            if sprite.alive() and sprite in tier:
+                self._retier(sprite, tier, pos)
+
+    def awake(self, group):
+        # members of group that are not sleeping
+        found = [sprite for sprite in self.full if sprite in group]
+        for tier in self.reduced:
+            found.extend(sprite for sprite in tier if sprite in group)
+        return found
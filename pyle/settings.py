@@ -14,13 +14,28 @@ CYAN = (0, 255, 255)
 # Game settings
 TITLE = 'Pyle'
 FPS = 60
+SIM_RATE = 60  # fixed simulation steps per second; drawing runs at FPS
+MAX_FRAME_TIME = 0.25  # seconds of simulation a single slow frame may add
+INTERPOLATE = True  # draw sprites between their last two simulated states
 WIDTH = 1024
 HEIGHT = 768
 TILESIZE = 64
 GRIDWIDTH = WIDTH / TILESIZE
 GRIDHEIGHT = HEIGHT / TILESIZE
 BGCOLOR = BROWN
+ASSET_WORKERS = 4  # threads decoding images and sounds at startup
+TEXT_CACHE_SIZE = 64  # rendered text surfaces kept for reuse
+PROFILE_WINDOW = 300  # frames kept for profiler percentiles and CSV dumps
+PROFILE_REFRESH = 30  # frames between profiler overlay redraws
+PROFILE_CSV = 'profile.csv'
 WALL_IMG = 'tileGreen_39.png'
+LEVELS = ['level1.tmx']  # campaign order, from resources/maps
+MAP_CHUNK_SIZE = 512  # pixels per side of a lazily rendered map chunk
+MAP_CHUNK_CACHE = 24  # rendered chunks kept in memory at once
+ROTATION_STEP = 2  # degrees between prebuilt sprite rotations
+TINT_CACHE_SIZE = 64  # damage-tinted rotation frames kept for reuse
+DIRTY_RECTS = False  # only push changed screen areas while the camera rests
+DIRTY_RECT_LIMIT = 0.4  # fraction of the screen above which to flip
 
 # Player settings
 PLAYER_HEALTH = 100
@@ -55,18 +70,35 @@ WEAPONS = dict(
     )
 )
 
+BULLET_POOL_SIZE = 64
+FLASH_POOL_SIZE = 8
+
 # Mob settings
 MOB_IMG = 'zombie1_hold.png'
 MOB_SPEEDS = [150, 175, 200]
 MOB_HIT_RECT = pg.Rect(0, 0, 30, 30)
 MOB_HEALTH = 100
+HEALTH_BAR_STEPS = 20  # distinct bar lengths prerendered per color
+HEALTH_BAR_HEIGHT = 7
 MOB_DAMAGE = 10
 MOB_KNOCKBACK = 20
 AVOID_RADIUS = 50
 DETECT_RADIUS = 400
+WAKE_RADIUS = 1200  # mobs and items further from the player sleep
+FLOW_RADIUS = DETECT_RADIUS + 4 * TILESIZE  # flow field reach from the player
+FULL_RATE_RADIUS = DETECT_RADIUS + 150  # awake mobs inside update every tick
+REDUCED_RATE = 4  # ticks between updates of the awake mobs outside it
+# 'sprite' runs each Mob's physics in Python; 'numpy' steps the whole horde
+# with vectorized array operations (requires numpy)
+MOB_ENGINE = 'sprite'
+HORDE_CHUNK = 256  # mobs per block in the vectorized avoidance pass
+# worker processes steering the 'numpy' horde one update behind the main
+# loop; 0 steers on the main thread
+AI_WORKERS = 0
 
 # Effects
 FLASH_DURATION = 50
+FLASH_SIZES = range(20, 51, 5)  # pre-scaled muzzle flash variants
 SPLAT_IMG = 'splat_green.png'
 MUZZLE_FLASHES = [
     'whitePuff15.png',
@@ -78,6 +110,12 @@ DAMAGE_ALPHA = [i for i in range(0, 255, 25)]
 NIGHT_COLOR = (20, 20, 20)
 LIGHT_RADIUS = (500, 500)
 LIGHT_MASK = 'light_350_med.png'
+LIGHTMAP_SCALE = 2  # lightmap is composed at 1/2 screen size, then upscaled
+LIGHTMAP_SMOOTH = False  # smoothscale the upscale: softer, but much slower
+LIGHT_MASK_STEP = 8  # light radii are rounded to this to share masks
+FLASH_LIGHT_RADIUS = 120
+LAMP_RADIUS = 200  # for Tiled 'light' objects without a size
+ITEM_LIGHT_RADIUS = 80  # glow around pickups at night
 
 # Layers
 LAYER_WALL = 1
@@ -98,6 +136,17 @@ BOB_SPEED = 0.4
 
 # Sounds
 BG_MUSIC = 'espionage.ogg'
+SOUND_CHANNELS = 16  # mixer channels shared by all effects
+SOUND_RADIUS = 800  # positional sounds further from the player are dropped
+SOUND_REPEAT = 60  # ms before the same sound may be started again
+# category: (priority, max voices); higher priority may cut lower ones
+SOUND_CATEGORIES = {
+    'effect': (4, 2),
+    'weapon': (3, 4),
+    'player': (3, 2),
+    'death': (2, 4),
+    'moan': (1, 3),
+}
 PLAYER_HIT_SOUND_CHANCE = 0.7
 PLAYER_HIT_SOUNDS = [
     'pain/8.wav',
@@ -0,0 +1,70 @@
+class SpatialGrid:
+    # Uniform grid of square cells mapping (col, row) to the sprites whose
+    # rects overlap that cell. Queries only visit the cells under a rect.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.order = {}
+
+    def _cell_range(self, rect):
+        size = self.cell_size
+        left = rect.left // size
+        top = rect.top // size
+        right = (rect.right - 1) // size
+        bottom = (rect.bottom - 1) // size
+        return left, top, max(left, right), max(top, bottom)
+
+    def insert(self, sprite):
+        # remember insertion order so query results match group order
+        self.order[sprite] = len(self.order)
+        left, top, right, bottom = self._cell_range(sprite.rect)
+        for col in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                self.cells.setdefault((col, row), []).append(sprite)
+
+    def insert_point(self, sprite, pos):
+        cell = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        self.cells.setdefault(cell, []).append(sprite)
+
+    def clear(self):
+        self.cells.clear()
+        self.order.clear()
+
+    def query(self, rect):
+        left, top, right, bottom = self._cell_range(rect)
+        if left == right and top == bottom:
+            return list(self.cells.get((left, top), ()))
+        found = set()
+        for col in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                found.update(self.cells.get((col, row), ()))
+        return sorted(found, key=self.order.__getitem__)
+
+    def query_radius(self, pos, radius):
+        # candidates only; callers still check the exact distance
+        size = self.cell_size
+        left = int((pos[0] - radius) // size)
+        top = int((pos[1] - radius) // size)
+        right = int((pos[0] + radius) // size)
+        bottom = int((pos[1] + radius) // size)
+        found = []
+        for col in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                found.extend(self.cells.get((col, row), ()))
+        return found
+
+    def collide(self, rect):
+        return [s for s in self.query(rect) if rect.colliderect(s.rect)]
+
+    def collideany(self, rect):
+        for sprite in self.query(rect):
+            if rect.colliderect(sprite.rect):
+                return sprite
+        return None
+
+
+def build_grid(sprites, cell_size):
+    grid = SpatialGrid(cell_size)
+    for sprite in sprites:
+        grid.insert(sprite)
+    return grid
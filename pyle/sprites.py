@@ -1,25 +1,27 @@
-import random
+import re
 import itertools
 import pygame as pg
 import pytweening as tween
 import xml.etree.ElementTree as xml
+from collections import OrderedDict
 from pyle.settings import PLAYER_SPEED, PLAYER_ROTATION_SPEED
 from pyle.settings import TILESIZE, BLACK, PLAYER_HIT_RECT
 from pyle.settings import MOB_SPEEDS, MOB_HIT_RECT, BARREL_OFFSET
-from pyle.settings import MOB_HEALTH, GREEN, YELLOW, RED, DAMAGE_ALPHA
+from pyle.settings import MOB_HEALTH, DAMAGE_ALPHA
 from pyle.settings import PLAYER_HEALTH, AVOID_RADIUS, FLASH_DURATION
 from pyle.settings import LAYER_WALL, LAYER_PLAYER, LAYER_BULLET, LAYER_MOB
 from pyle.settings import LAYER_EFFECTS, LAYER_ITEMS, BOB_RANGE, BOB_SPEED
 from pyle.settings import DETECT_RADIUS, ZOMBIE_MOAN_CHANCE, WEAPONS
+from pyle.settings import ITEM_LIGHT_RADIUS, TINT_CACHE_SIZE
 
 
 def collide_hit_rect(a, b):
     return a.hit_rect.colliderect(b.rect)
 
 
-def collide_with_walls(sprite, group, dir):
+def collide_with_walls(sprite, walls, dir):
     if 'x' == dir:
-        hits = pg.sprite.spritecollide(sprite, group, False, collide_hit_rect)
+        hits = walls.collide(sprite.hit_rect)
         if hits:
             if hits[0].rect.centerx > sprite.hit_rect.centerx:
                 sprite.pos.x = hits[0].rect.left - sprite.hit_rect.width / 2
@@ -28,7 +30,7 @@ def collide_with_walls(sprite, group, dir):
             sprite.vel.x = 0
             sprite.hit_rect.centerx = sprite.pos.x
     elif 'y' == dir:
-        hits = pg.sprite.spritecollide(sprite, group, False, collide_hit_rect)
+        hits = walls.collide(sprite.hit_rect)
         if hits:
             if hits[0].rect.centery > sprite.hit_rect.centery:
                 sprite.pos.y = hits[0].rect.top - sprite.hit_rect.height / 2
@@ -38,28 +40,81 @@ def collide_with_walls(sprite, group, dir):
             sprite.hit_rect.centery = sprite.pos.y
 
 
+def _natural_key(name):
+    # 'walk_10.png' sorts after 'walk_9.png'
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', name)]
+
+
 class Spritesheet:
-    def __init__(self, filename):
-        self.spritesheet = pg.image.load(filename).convert()
+    def __init__(self, filename, image=None):
+        if image is None:
+            image = pg.image.load(filename).convert()
+        self.spritesheet = image
+        self.images = {}
+        # name -> rect, parsed once from the atlas
+        self.rects = {}
         try:
-            self.coords = xml.parse(filename.replace('png', 'xml')).getroot()
+            coords = xml.parse(filename.replace('png', 'xml')).getroot()
         except Exception:
-            self.coords = None
+            coords = None
+        if coords is not None:
+            for texture in coords.iter('SubTexture'):
+                props = texture.attrib
+                self.rects[props['name']] = pg.Rect(
+                    int(props['x']), int(props['y']),
+                    int(props['width']), int(props['height']))
 
     def get_image_at(self, x, y, width, height):
-        image = pg.Surface((width, height))
-        image.blit(self.spritesheet, (0, 0), (x, y, width, height))
+        # a view into the sheet, not a copy; copy() it before drawing on it
+        image = self.spritesheet.subsurface((x, y, width, height))
         # image = pg.transform.scale(image, (width // 2, height // 2))
         image.set_colorkey(BLACK)
         return image
 
     def get_image(self, name):
-        props = self.coords.find(".//SubTexture[@name='%s']" % name).attrib
-        x = int(props['x'])
-        y = int(props['y'])
-        width = int(props['width'])
-        height = int(props['height'])
-        return self.get_image_at(x, y, width, height)
+        image = self.images.get(name)
+        if image is None:
+            image = self.get_image_at(*self.rects[name])
+            self.images[name] = image
+        return image
+
+    def get_animation(self, prefix):
+        # every frame whose name starts with prefix, in natural order
+        names = sorted((n for n in self.rects if n.startswith(prefix)),
+                       key=_natural_key)
+        return [self.get_image(name) for name in names]
+
+
+class RotationCache:
+    def __init__(self, image, step, tint_capacity=TINT_CACHE_SIZE):
+        self.step = step
+        self.count = int(round(360 / step))
+        self.frames = [pg.transform.rotate(image, i * step)
+                       for i in range(self.count)]
+        self.tint_capacity = tint_capacity
+        self.tinted = OrderedDict()
+
+    def index(self, rot):
+        return int(round(rot / self.step)) % self.count
+
+    def get(self, rot):
+        return self.frames[self.index(rot)]
+
+    def get_tinted(self, rot, alpha):
+        # damage tints are only ever needed for a few frames at a time,
+        # so build them on first use and keep only the recent ones
+        key = (self.index(rot), alpha)
+        frame = self.tinted.get(key)
+        if frame is None:
+            frame = self.frames[key[0]].copy()
+            frame.fill((255, 0, 0, alpha), special_flags=pg.BLEND_RGBA_MULT)
+            self.tinted[key] = frame
+            if len(self.tinted) > self.tint_capacity:
+                self.tinted.popitem(last=False)
+        else:
+            self.tinted.move_to_end(key)
+        return frame
 
 
 class Player(pg.sprite.Sprite):
@@ -85,22 +140,28 @@ class Player(pg.sprite.Sprite):
     def update(self):
         self._handle_keys()
         self.rot = (self.rot + self.rot_speed * self.game.dt) % 360
-        self.image = pg.transform.rotate(self.game.player_img, self.rot)
+        self.image = self.game.player_rotations.get(self.rot)
         if self.damaged:
             try:
-                self.image.fill((255, 0, 0, next(self.damage_alpha)),
-                                special_flags=pg.BLEND_RGBA_MULT)
-            except Exception:
+                self.image = self.game.player_rotations.get_tinted(
+                    self.rot, next(self.damage_alpha))
+            except StopIteration:
                 self.damaged = False
         self.rect = self.image.get_rect()
         self.rect.center = self.pos
         self.pos += self.vel * self.game.dt
         self.hit_rect.centerx = self.pos.x
-        collide_with_walls(self, self.game.walls, 'x')
+        collide_with_walls(self, self.game.wall_grid, 'x')
         self.hit_rect.centery = self.pos.y
-        collide_with_walls(self, self.game.walls, 'y')
+        collide_with_walls(self, self.game.wall_grid, 'y')
         self.rect.center = self.hit_rect.center
 
+    def rotated(self, rot):
+        # frame for an in-between rot; keeps the damage tint as it is
+        if self.damaged:
+            return self.image
+        return self.game.player_rotations.get(rot)
+
     def hit(self):
         self.damaged = True
         self.damage_alpha = itertools.chain(DAMAGE_ALPHA * 2)
@@ -113,7 +174,7 @@ class Player(pg.sprite.Sprite):
     def _handle_keys(self):
         self.rot_speed = 0
         self.vel = pg.Vector2(0, 0)
-        keys = pg.key.get_pressed()
+        keys = self.game.get_keys()
         if keys[pg.K_LEFT] or keys[pg.K_a]:
             self.rot_speed = PLAYER_ROTATION_SPEED
         if keys[pg.K_RIGHT] or keys[pg.K_d]:
@@ -126,7 +187,7 @@ class Player(pg.sprite.Sprite):
             self._shoot()
 
     def _shoot(self):
-        now = pg.time.get_ticks()
+        now = self.game.now
         weapon = WEAPONS[self.weapon]
         if now - self.last_shot > weapon['rate']:
             self.last_shot = now
@@ -134,39 +195,56 @@ class Player(pg.sprite.Sprite):
             pos = self.pos + BARREL_OFFSET.rotate(-self.rot)
             self.vel = pg.Vector2(-weapon['kickback'], 0).rotate(-self.rot)
             for i in range(weapon['bullet_count']):
-                Bullet(self.game, pos, dir, weapon)
-                snd = random.choice(self.game.weapon_sounds[self.weapon])
-                if snd.get_num_channels() > 2:
-                    snd.stop()
-                snd.play()
-            MuzzleFlash(self.game, pos)
+                self.game.bullet_pool.spawn(pos, dir, weapon)
+                self.game.audio.play(self.game.random.choice(
+                    self.game.weapon_sounds[self.weapon]), 'weapon')
+            self.game.flash_pool.spawn(pos)
 
 
 class Bullet(pg.sprite.Sprite):
-    def __init__(self, game, pos, dir, weapon):
+    def __init__(self, game, pool):
         self._layer = LAYER_BULLET
-        pg.sprite.Sprite.__init__(self, game.all_sprites, game.bullets)
+        pg.sprite.Sprite.__init__(self)
         self.game = game
+        self.pool = pool
+        self.weapon = None
+        self.image = None
+        self.rect = None
+        self.hit_rect = None
+        self.pos = pg.Vector2(0, 0)
+        self.prev_pos = pg.Vector2(0, 0)
+        self.vel = pg.Vector2(0, 0)
+        self.spawn_time = 0
+
+    def spawn(self, pos, dir, weapon):
+        self.add(self.game.all_sprites, self.game.bullets)
         self.weapon = weapon
-        self.image = game.bullet_images[weapon['bullet_size']]
+        self.image = self.game.bullet_images[weapon['bullet_size']]
         self.rect = self.image.get_rect()
         self.hit_rect = self.rect
-        self.pos = pg.Vector2(pos)
+        self.pos.update(pos)
+        self.prev_pos.update(pos)
         self.rect.center = pos
-        spread = random.uniform(-weapon['spread'], weapon['spread'])
+        spread = self.game.random.uniform(-weapon['spread'],
+                                          weapon['spread'])
         self.vel = dir.rotate(spread) * weapon['bullet_speed']
-        self.vel *= random.uniform(0.9, 1.1)
-        self.spawn_time = pg.time.get_ticks()
+        self.vel *= self.game.random.uniform(0.9, 1.1)
+        self.spawn_time = self.game.now
 
     def update(self):
+        # walls and mobs are hit in Game.update's swept collision pass
+        self.prev_pos.update(self.pos)
         self.pos += self.vel * self.game.dt
         self.rect.center = self.pos
-        if pg.sprite.spritecollideany(self, self.game.walls):
-            self.kill()
-        if pg.time.get_ticks() - self.spawn_time > \
+        if self.game.now - self.spawn_time > \
                 self.weapon['bullet_lifetime']:
             self.kill()
 
+    def kill(self):
+        if self.alive():
+            pg.sprite.Sprite.kill(self)
+            self.pool.release(self)
+
 
 class Wall(pg.sprite.Sprite):
     def __init__(self, game, x, y):
@@ -197,7 +275,8 @@ class Mob(pg.sprite.Sprite):
         self._layer = LAYER_MOB
         pg.sprite.Sprite.__init__(self, game.all_sprites, game.mobs)
         self.game = game
-        self.image = game.mob_img.copy()
+        game.scheduler.add(self)
+        self.image = game.mob_img
         self.rect = self.image.get_rect()
         self.rect.center = (x, y)
         self.hit_rect = MOB_HIT_RECT.copy()
@@ -208,81 +287,97 @@ class Mob(pg.sprite.Sprite):
         self.rect.center = self.pos
         self.rot = 0
         self.health = MOB_HEALTH
-        self.health_bar = None
-        self.speed = random.choice(MOB_SPEEDS)
+        self.speed = self.game.random.choice(MOB_SPEEDS)
         self.target = game.player
 
     def update(self):
         target_dist = self.target.pos - self.pos
         if target_dist.length_squared() < DETECT_RADIUS**2:
-            if random.random() < ZOMBIE_MOAN_CHANCE:
-                random.choice(self.game.zombie_moan_sounds).play()
-            self.rot = target_dist.angle_to(pg.Vector2(1, 0))
-            self.image = pg.transform.rotate(self.game.mob_img, self.rot)
+            if self.game.random.random() < ZOMBIE_MOAN_CHANCE:
+                self.game.audio.play(self.game.random.choice(
+                    self.game.zombie_moan_sounds), 'moan', self.pos)
+            # follow the shared flow field around walls; steer straight at
+            # the target once next to it
+            direction = self.game.flow_field.direction(self.pos)
+            if direction is None:
+                direction = target_dist
+            self.rot = direction.angle_to(pg.Vector2(1, 0))
+            self.image = self.game.mob_rotations.get(self.rot)
             self.rect = self.image.get_rect()
             self.rect.center = self.pos
-            self.acc = pg.Vector2(1, 0).rotate(-self.rot)
+            seek = pg.Vector2(1, 0).rotate(-self.rot)
+            self.acc = pg.Vector2(seek)
             self.avoid_mobs()
+            # a neighbour straight ahead can cancel the seek exactly, as
+            # flow directions and wall stops line mobs up; keep seeking then
+            if self.acc.length_squared() < 1e-12:
+                self.acc = seek
             self.acc.scale_to_length(self.speed)
             self.acc += self.vel * -1
             self.vel += self.acc * self.game.dt
             self.pos += self.vel * self.game.dt \
                 + 0.5 * self.acc * self.game.dt ** 2
             self.hit_rect.centerx = self.pos.x
-            collide_with_walls(self, self.game.walls, 'x')
+            collide_with_walls(self, self.game.wall_grid, 'x')
             self.hit_rect.centery = self.pos.y
-            collide_with_walls(self, self.game.walls, 'y')
+            collide_with_walls(self, self.game.wall_grid, 'y')
             self.rect.center = self.hit_rect.center
         if self.health <= 0:
-            random.choice(self.game.zombie_death_sounds).play()
-            self.kill()
-            self.game.map_img.blit(self.game.splat_img,
-                                   self.pos - pg.Vector2(32, 32))
+            self.die()
+
+    def rotated(self, rot):
+        return self.game.mob_rotations.get(rot)
+
+    def die(self):
+        self.game.audio.play(self.game.random.choice(
+            self.game.zombie_death_sounds), 'death', self.pos)
+        self.kill()
+        self.game.map_chunks.add_decal(self.game.splat_img,
+                                       self.pos - pg.Vector2(32, 32))
 
     def avoid_mobs(self):
-        for mob in self.game.mobs:
-            if mob != self:
+        for mob in self.game.mob_grid.query_radius(self.pos, AVOID_RADIUS):
+            if mob is not self:
                 dist = self.pos - mob.pos
-                if 0 < dist.length() < AVOID_RADIUS:
+                if 0 < dist.length_squared() < AVOID_RADIUS**2:
                     self.acc += dist.normalize()
 
-    def draw_health(self):
-        if self.health >= MOB_HEALTH:
-            return
-        if self.health > 60:
-            color = GREEN
-        elif self.health > 30:
-            color = YELLOW
-        else:
-            color = RED
-        width = int(self.rect.width * self.health / MOB_HEALTH)
-        self.health_bar = pg.Rect(0, 0, width, 7)
-        pg.draw.rect(self.image, color, self.health_bar)
-
 
 class MuzzleFlash(pg.sprite.Sprite):
-    def __init__(self, game, pos):
+    def __init__(self, game, pool):
         self._layer = LAYER_EFFECTS
-        pg.sprite.Sprite.__init__(self, game.all_sprites)
+        pg.sprite.Sprite.__init__(self)
         self.game = game
-        size = random.randint(20, 50)
-        image = random.choice(self.game.gun_flashes)
-        self.image = pg.transform.scale(image, (size, size))
+        self.pool = pool
+        self.image = None
+        self.rect = None
+        self.pos = None
+        self.spawn_time = 0
+
+    def spawn(self, pos):
+        self.add(self.game.all_sprites)
+        self.image = self.game.random.choice(self.game.gun_flashes)
         self.rect = self.image.get_rect()
         self.pos = pos
         self.rect.center = pos
-        self.spawn_time = pg.time.get_ticks()
+        self.spawn_time = self.game.now
 
     def update(self):
-        if pg.time.get_ticks() - self.spawn_time > FLASH_DURATION:
+        if self.game.now - self.spawn_time > FLASH_DURATION:
             self.kill()
 
+    def kill(self):
+        if self.alive():
+            pg.sprite.Sprite.kill(self)
+            self.pool.release(self)
+
 
 class Item(pg.sprite.Sprite):
     def __init__(self, game, pos, type):
         self._layer = LAYER_ITEMS
         pg.sprite.Sprite.__init__(self, game.all_sprites, game.items)
         self.game = game
+        game.scheduler.add(self, reducible=False)
         self.image = self.game.item_images[type]
         self.rect = self.image.get_rect()
         self.hit_rect = self.rect
@@ -292,6 +387,12 @@ class Item(pg.sprite.Sprite):
         self.tween = tween.easeInOutSine
         self.step = 0
         self.dir = 1
+        # lit at night; the glow stays put while the item bobs
+        game.lighting.add_static(pos, ITEM_LIGHT_RADIUS)
+
+    def kill(self):
+        self.game.lighting.remove_static(self.pos)
+        pg.sprite.Sprite.kill(self)
 
     def update(self):
         # bobbing motion
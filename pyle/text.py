@@ -0,0 +1,31 @@
+import pygame as pg
+from collections import OrderedDict
+from pyle.settings import TEXT_CACHE_SIZE
+
+
+class TextCache:
+    # Fonts are opened once per (path, size); rendered strings are kept in
+    # an LRU so unchanged HUD text is just a blit.
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, name, size):
+        font = self.fonts.get((name, size))
+        if font is None:
+            font = pg.font.Font(name, size)
+            self.fonts[(name, size)] = font
+        return font
+
+    def render(self, text, name, size, color):
+        key = (text, name, size, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.font(name, size).render(text, True, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
@@ -1,22 +1,73 @@
 import pygame as pg
 import pytmx
+from pytmx.util_pygame import handle_transformation, smart_convert
+from collections import OrderedDict, namedtuple
 from pyle.settings import TILESIZE, WIDTH, HEIGHT
+from pyle.settings import MAP_CHUNK_SIZE, MAP_CHUNK_CACHE
+
+
+MapObject = namedtuple('MapObject', 'name x y width height')
 
 
 class TiledMap:
-    def __init__(self, filename):
-        self.tm = pytmx.load_pygame(filename, pixelalpha=True)
+    # convert=False leaves the tile images as loaded, so the map can be
+    # parsed and rendered on a worker thread; call convert() on the main
+    # thread before drawing it to the screen
+    def __init__(self, filename, convert=True):
+        self.filename = filename
+        self.unconverted = []  # (tile, tileset colorkey)
+        self.tm = pytmx.TiledMap(filename, image_loader=self._tile_loader,
+                                 pixelalpha=True)
+        if convert:
+            self.convert()
         self.width = self.tm.width * self.tm.tilewidth
         self.height = self.tm.height * self.tm.tileheight
+        self.objects = [MapObject(o.name, o.x, o.y, o.width, o.height)
+                        for o in self.tm.objects]
+
+    def _tile_loader(self, filename, colorkey, **kwargs):
+        # pytmx.util_pygame's loader, with convert/convert_alpha deferred
+        if colorkey:
+            colorkey = pg.Color('#' + colorkey)
+        image = pg.image.load(filename)
+
+        def load_tile(rect=None, flags=None):
+            tile = image.subsurface(rect) if rect else image.copy()
+            if flags:
+                tile = handle_transformation(tile, flags)
+            if colorkey:
+                tile.set_colorkey(colorkey)
+            self.unconverted.append((tile, colorkey))
+            return tile
+        return load_tile
 
-    def render(self, surface):
+    def convert(self):
+        colorkeys = dict((id(tile), key) for tile, key in self.unconverted)
+        images = self.tm.images
+        for gid, tile in enumerate(images):
+            if tile is not None and id(tile) in colorkeys:
+                images[gid] = smart_convert(tile, colorkeys[id(tile)], True)
+        self.unconverted = []
+
+    def render(self, surface, area=None):
+        # draw the tiles overlapping area (in map pixels) with area.topleft
+        # at the surface origin; the whole map by default
+        if area is None:
+            area = pg.Rect(0, 0, self.width, self.height)
+        tw = self.tm.tilewidth
+        th = self.tm.tileheight
+        cols = range(max(0, area.left // tw),
+                     min(self.tm.width, (area.right - 1) // tw + 1))
+        rows = range(max(0, area.top // th),
+                     min(self.tm.height, (area.bottom - 1) // th + 1))
         for layer in self.tm.visible_layers:
             if isinstance(layer, pytmx.TiledTileLayer):
-                for x, y, gid in layer:
-                    tile = self.tm.get_tile_image_by_gid(gid)
-                    if tile:
-                        surface.blit(tile, (x * self.tm.tilewidth,
-                                            y * self.tm.tileheight))
+                for y in rows:
+                    for x in cols:
+                        tile = self.tm.get_tile_image_by_gid(layer.data[y][x])
+                        if tile:
+                            surface.blit(tile, (x * tw - area.x,
+                                                y * th - area.y))
 
     def make_map(self):
         temp_surface = pg.Surface((self.width, self.height))
@@ -24,6 +75,74 @@ class TiledMap:
         return temp_surface
 
 
+class ChunkedMap:
+    # Renders the map in square chunks on demand, keeping only the most
+    # recently drawn ones. Decals (splats) are blitted onto resident chunks
+    # and remembered per chunk so an evicted chunk can be rebuilt with them.
+    def __init__(self, tiled_map, chunk_size=MAP_CHUNK_SIZE,
+                 max_chunks=MAP_CHUNK_CACHE):
+        self.map = tiled_map
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.width = tiled_map.width
+        self.height = tiled_map.height
+        self.chunks = OrderedDict()
+        self.decals = {}
+        # map areas touched by decals since the last take_changed()
+        self.changed = []
+
+    def chunk_rect(self, key):
+        size = self.chunk_size
+        rect = pg.Rect(key[0] * size, key[1] * size, size, size)
+        return rect.clip(pg.Rect(0, 0, self.width, self.height))
+
+    def keys(self, rect):
+        rect = rect.clip(pg.Rect(0, 0, self.width, self.height))
+        size = self.chunk_size
+        for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for col in range(rect.left // size, (rect.right - 1) // size + 1):
+                yield col, row
+
+    def _render(self, key):
+        rect = self.chunk_rect(key)
+        surface = pg.Surface(rect.size)
+        self.map.render(surface, rect)
+        for image, pos in self.decals.get(key, ()):
+            surface.blit(image, (pos[0] - rect.x, pos[1] - rect.y))
+        return surface
+
+    def get(self, key):
+        surface = self.chunks.get(key)
+        if surface is None:
+            surface = self._render(key)
+            self.chunks[key] = surface
+            if len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+        self.chunks.move_to_end(key)
+        return surface
+
+    def add_decal(self, image, pos):
+        rect = image.get_rect(topleft=(int(pos[0]), int(pos[1])))
+        for key in self.keys(rect):
+            self.decals.setdefault(key, []).append((image, rect.topleft))
+            surface = self.chunks.get(key)
+            if surface is not None:
+                origin = self.chunk_rect(key)
+                surface.blit(image, (rect.x - origin.x, rect.y - origin.y))
+        self.changed.append(rect)
+
+    def take_changed(self):
+        changed = self.changed
+        self.changed = []
+        return changed
+
+    def draw(self, surface, camera, area=None):
+        # area limits drawing to part of the view (in map coordinates)
+        for key in self.keys(area or camera.view):
+            surface.blit(self.get(key),
+                         camera.apply_rect(self.chunk_rect(key)))
+
+
 class Map:
     def __init__(self, filename):
         self.data = []
@@ -42,6 +161,9 @@ class Camera:
         self.camera = pg.Rect(0, 0, width, height)
         self.width = width
         self.height = height
+        # offsets from the last two update()s, blended by interpolate()
+        self.last = None
+        self.goal = None
 
     def apply(self, entity):
         return entity.rect.move(self.camera.topleft)
@@ -49,6 +171,11 @@ class Camera:
     def apply_rect(self, rect):
         return rect.move(self.camera.topleft)
 
+    @property
+    def view(self):
+        # the visible part of the map, in map coordinates
+        return pg.Rect(-self.camera.x, -self.camera.y, WIDTH, HEIGHT)
+
     def update(self, target):
         x = -target.rect.centerx + int(WIDTH / 2)
         y = -target.rect.centery + int(HEIGHT / 2)
@@ -58,3 +185,12 @@ class Camera:
         x = max(-(self.width - WIDTH), x)
         y = max(-(self.height - HEIGHT), y)
         self.camera = pg.Rect(x, y, self.width, self.height)
+        self.last = self.goal or (x, y)
+        self.goal = (x, y)
+
+    def interpolate(self, alpha):
+        if self.goal is None:
+            return
+        (x0, y0), (x1, y1) = self.last, self.goal
+        self.camera.topleft = (round(x0 + (x1 - x0) * alpha),
+                               round(y0 + (y1 - y0) * alpha))